@@ -1,23 +1,131 @@
-"""Create database connection session object"""
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+"""Create database connection session object
 
+The engine options depend on the configured backend. SQLite connections
+get WAL journaling and the related pragmas applied on connect so readers
+are not blocked by a login writing its refresh token, while PostgreSQL
+(through asyncpg) gets a sized connection pool and a prepared statement
+cache. Statement logging is off unless DB_ECHO is set.
+
+The engine is only created on first use, so importing the application
+doesn't load the database driver, and a preforking server creates one
+engine per worker instead of inheriting the connections of its master.
+"""
+import time
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.utils.metrics import stage_histogram
 from app.utils.settings import settings
 
-engine = create_engine(
-    settings.db_url,
-    echo=True,
-    connect_args={"check_same_thread": False},
+POOL_CHECKOUT_STAGE = stage_histogram("db_pool_checkout")
+
+
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """Connection pool recording how long each checkout waited for a connection"""
+
+    # logs as the SQLAlchemy pool it extends, so DB_ECHO and the sqlalchemy logger govern it
+    _sqla_logger_namespace = "sqlalchemy.pool.impl.AsyncAdaptedQueuePool"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_STAGE.observe(time.perf_counter() - start)
+
+
+def get_engine_options(db_url: str):
+    """Function for building the engine keyword arguments for a database URL"""
+    url = make_url(db_url)
+    backend = url.get_backend_name()
+    options = {"echo": settings.db_echo}
+
+    pool_options = {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_timeout": settings.db_pool_timeout,
+    }
+
+    if backend == "sqlite":
+        options["connect_args"] = {"check_same_thread": False}
+
+        # in-memory databases live in a single connection, keep the default pool;
+        # file databases would otherwise open a new connection for every session
+        if url.database not in (None, "", ":memory:"):
+            options.update(pool_options)
+            options["poolclass"] = TimedAsyncAdaptedQueuePool
+    elif backend == "postgresql":
+        options.update(pool_options)
+        options["poolclass"] = TimedAsyncAdaptedQueuePool
+        options["pool_pre_ping"] = True
+        options["connect_args"] = {
+            "prepared_statement_cache_size": settings.db_statement_cache_size,
+        }
+    else:
+        options.update(pool_options)
+
+    return options
+
+
+def set_sqlite_pragmas(dbapi_connection, _connection_record):
+    """Function applying the SQLite tuning pragmas on every new connection"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+    cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+    cursor.execute(f"PRAGMA busy_timeout={settings.sqlite_busy_timeout}")
+    cursor.execute(f"PRAGMA mmap_size={settings.sqlite_mmap_size}")
+    cursor.close()
+
+
+engine: Optional[AsyncEngine] = None
+
+SessionLocal = async_sessionmaker(
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
 )
 
-SessionLocal = sessionmaker()
-SessionLocal.configure(autocommit=False, autoflush=False, bind=engine)
+
+def init_engine() -> AsyncEngine:
+    """Function for creating the process-wide database engine"""
+    global engine  # pylint: disable=global-statement
+
+    if engine is None:
+        engine = create_async_engine(settings.db_url, **get_engine_options(settings.db_url))
+
+        if engine.dialect.name == "sqlite":
+            event.listen(engine.sync_engine, "connect", set_sqlite_pragmas)
+
+        SessionLocal.configure(bind=engine)
+
+    return engine
+
+
+async def dispose_engine():
+    """Function for closing every connection held by the database engine"""
+    global engine  # pylint: disable=global-statement
+
+    if engine is not None:
+        await engine.dispose()
+        engine = None
+
+
+def open_session() -> AsyncSession:
+    """Function for opening an AsyncSession, creating the database engine if needed"""
+    init_engine()
+    return SessionLocal()
 
 
-def get_db():
-    """Function for retrieving a global Session database connection"""
-    db = SessionLocal()
-    try:
+async def get_db():
+    """Function for retrieving a global AsyncSession database connection"""
+    async with open_session() as db:
         yield db
-    finally:
-        db.close()
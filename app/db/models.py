@@ -2,7 +2,7 @@
 import uuid
 from typing import List
 from datetime import datetime
-from sqlalchemy import Column, ForeignKey, String, DateTime
+from sqlalchemy import Column, ForeignKey, Index, String, DateTime
 from sqlalchemy.orm import relationship, Mapped
 from .base import Base
 
@@ -33,5 +33,9 @@ class UserTokenModel(Base):
 
     __tablename__ = "user_token"
     uuid = Column(String, ForeignKey("user.uuid", ondelete="CASCADE"), primary_key=True)
-    refresh_token = Column(String, primary_key=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # SHA-256 hex digest of the refresh token, raw tokens are never stored
+    token_hash = Column(String(64), primary_key=True, unique=True, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+    # lists and caps the sessions of a user without scanning all of them
+    __table_args__ = (Index("ix_user_token_uuid_created_at", "uuid", "created_at"),)
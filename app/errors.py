@@ -7,3 +7,15 @@ class TokenDecodingException(Exception):
 
 class TokenExpiredException(Exception):
     """Exception raised when trying to decode an expired token"""
+
+
+class PasswordHasherBusyException(Exception):
+    """Exception raised when the password hashing queue is full"""
+
+
+class SigningKeyException(Exception):
+    """Exception raised when the configured token signing keys are missing or invalid"""
+
+
+class ServiceUnavailableException(Exception):
+    """Exception raised when a dependency fails, times out or its circuit breaker is open"""
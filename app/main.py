@@ -1,14 +1,74 @@
-"""Main module for the REST API"""
-import uvicorn
+"""Main module for the REST API
+
+The application is built by create_app, and every shared resource (database
+engine, Redis pool, hashing workers, background tasks) is created by its
+lifespan rather than at import time.
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.version import __version__
+from app.db.connection import dispose_engine, init_engine
 from app.schemas.response_result import ResponseResult
-from app.routers import auth
+from app.routers import admin, auth, jwks, metrics
+from app.services.blocklist import blocklist_mirror, blocklist_write_queue
+from app.services.sweeper import run_sweeper
+from app.utils.jwt import get_access_token_secret
+from app.utils.keys import KeyRing
+from app.utils.metrics import MetricsMiddleware
+from app.utils.profiler import ProfilerMiddleware, instrument_engine, stack_sampler
+from app.utils.password import password_hasher
+from app.utils.redis import close_redis_pool, init_redis_pool
+from app.utils.settings import settings
+from app.utils.warmup import warm_up
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """Create the shared resources on startup and release them on shutdown"""
+    access_token_secret = get_access_token_secret()
+    if isinstance(access_token_secret, KeyRing):
+        access_token_secret.load()
+
+    engine = init_engine()
+    if settings.profiler_enabled:
+        instrument_engine(engine.sync_engine)
 
+    redis_pool = init_redis_pool()
+    password_hasher.start()
+    if settings.warmup_enabled:
+        await warm_up(redis_pool)
+    blocklist_write_queue.start(redis_pool)
+    if settings.blocklist_mirror:
+        blocklist_mirror.start(redis_pool)
+
+    sweeper_task = None
+    if settings.token_sweeper_enabled:
+        sweeper_task = asyncio.create_task(
+            run_sweeper(
+                settings.token_sweeper_interval,
+                settings.token_sweeper_batch_size,
+                settings.token_sweeper_batch_pause,
+            )
+        )
+
+    yield
+
+    if sweeper_task is not None:
+        sweeper_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await sweeper_task
+    stack_sampler.stop()
+    await blocklist_mirror.stop()
+    await blocklist_write_queue.stop()
+    password_hasher.shutdown()
+    await close_redis_pool()
+    await dispose_engine()
 
-app = FastAPI(version=__version__)
 
 origins = [
     "http://localhost",
@@ -17,22 +77,59 @@ origins = [
     "https://login.rafaelf.dev",
 ]
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
-app.include_router(auth.router, tags=["auth"])
+def create_app() -> FastAPI:
+    """Function for building the API application with its middlewares and routers"""
+    # the server only configures its own loggers, the application ones log from the root
+    logging.basicConfig(
+        level=settings.log_level.upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+
+    fastapi_app = FastAPI(
+        version=__version__,
+        lifespan=lifespan,
+        default_response_class=ORJSONResponse,
+    )
 
+    fastapi_app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
 
-@app.get("/", response_model=ResponseResult, response_model_exclude_unset=True)
-async def root() -> ResponseResult:
-    """Root test endpoint"""
-    return {"status": True, "message": "Hello FastAPI!"}
+    fastapi_app.include_router(auth.router, tags=["auth"])
+    fastapi_app.include_router(jwks.router, tags=["jwks"])
+    fastapi_app.include_router(admin.router, tags=["admin"])
+
+    if settings.metrics_enabled:
+        fastapi_app.add_middleware(MetricsMiddleware)
+        fastapi_app.include_router(metrics.router, tags=["metrics"])
+
+    if settings.profiler_enabled:
+        fastapi_app.add_middleware(ProfilerMiddleware)
+
+    @fastapi_app.get("/", response_model=ResponseResult, response_model_exclude_unset=True)
+    async def root() -> ResponseResult:
+        """Root test endpoint"""
+        return {"status": True, "message": "Hello FastAPI!"}
+
+    return fastapi_app
+
+
+app = create_app()
 
 
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, log_level="debug", reload=True)
+    import uvicorn  # pylint: disable=import-outside-toplevel
+
+    uvicorn.run(
+        "app.main:app",
+        host="0.0.0.0",
+        port=8000,
+        log_level="debug",
+        reload=True,
+        forwarded_allow_ips=settings.forwarded_allow_ips,
+    )
@@ -0,0 +1,83 @@
+"""Store hashed refresh tokens in user_token
+
+Revision ID: 5b2e9c4d7a1f
+Revises: edfc880cf085
+Create Date: 2026-10-18 10:12:41.318406
+
+"""
+import hashlib
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b2e9c4d7a1f'
+down_revision: Union[str, None] = 'edfc880cf085'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+
+user_token = sa.table(
+    'user_token',
+    sa.column('uuid', sa.String()),
+    sa.column('refresh_token', sa.String()),
+    sa.column('token_hash', sa.String(64)),
+)
+
+
+def upgrade() -> None:
+    op.add_column('user_token', sa.Column('token_hash', sa.String(length=64), nullable=True))
+
+    # backfill the digests in batches to avoid loading the whole table at once
+    connection = op.get_bind()
+    while True:
+        rows = connection.execute(
+            sa.select(user_token.c.uuid, user_token.c.refresh_token)
+            .where(user_token.c.token_hash.is_(None))
+            .limit(BATCH_SIZE)
+        ).all()
+
+        if not rows:
+            break
+
+        connection.execute(
+            user_token.update()
+            .where(user_token.c.uuid == sa.bindparam('b_uuid'))
+            .where(user_token.c.refresh_token == sa.bindparam('b_refresh_token'))
+            .values(token_hash=sa.bindparam('b_token_hash')),
+            [
+                {
+                    'b_uuid': row.uuid,
+                    'b_refresh_token': row.refresh_token,
+                    'b_token_hash': hashlib.sha256(row.refresh_token.encode()).hexdigest(),
+                }
+                for row in rows
+            ],
+        )
+
+    # SQLite reflects the original primary key without a name
+    pk_name = sa.inspect(connection).get_pk_constraint('user_token')['name']
+
+    with op.batch_alter_table('user_token', recreate='always') as batch_op:
+        if pk_name:
+            batch_op.drop_constraint(pk_name, type_='primary')
+        batch_op.drop_column('refresh_token')
+        batch_op.alter_column('token_hash', existing_type=sa.String(length=64), nullable=False)
+        batch_op.create_primary_key('pk_user_token', ['uuid', 'token_hash'])
+        batch_op.create_index(batch_op.f('ix_user_token_token_hash'), ['token_hash'], unique=True)
+
+
+def downgrade() -> None:
+    # the raw refresh tokens can't be recovered from their digests, so every
+    # session is discarded and the users will have to sign in again
+    op.execute(user_token.delete())
+
+    with op.batch_alter_table('user_token', recreate='always') as batch_op:
+        batch_op.drop_constraint('pk_user_token', type_='primary')
+        batch_op.drop_index(batch_op.f('ix_user_token_token_hash'))
+        batch_op.drop_column('token_hash')
+        batch_op.add_column(sa.Column('refresh_token', sa.String(), nullable=False))
+        batch_op.create_primary_key('pk_user_token', ['uuid', 'refresh_token'])
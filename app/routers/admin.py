@@ -0,0 +1,49 @@
+"""Administration endpoints, only available with the admin API key"""
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from app.schemas.response_result import ResponseResult, UserImportResult
+from app.services.user_import import import_users_ndjson, iter_lines
+from app.utils.auth import verify_admin_key
+from app.utils.profiler import profile_store
+from app.utils.settings import settings
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(verify_admin_key)])
+
+
+@router.post("/users/import", response_model=UserImportResult)
+async def import_users(request: Request):
+    """Endpoint for importing users streamed as NDJSON, one user per line"""
+    summary = await import_users_ndjson(
+        iter_lines(request.stream()), settings.user_import_batch_size
+    )
+
+    return {"status": True, "message": "Success", "data": summary}
+
+
+def load_profile(profile_id: str):
+    """Function returning a stored profile, raising 404 when it doesn't exist"""
+    record = profile_store.load(profile_id)
+
+    if record is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+
+    return record
+
+
+@router.get("/profiles", response_model=ResponseResult)
+async def list_profiles():
+    """Endpoint listing the stored request profiles, newest first"""
+    return {"status": True, "message": "Success", "data": profile_store.list()}
+
+
+@router.get("/profiles/{profile_id}", response_model=ResponseResult)
+async def get_profile(profile_id: str):
+    """Endpoint returning a stored request profile with its stacks and SQL statements"""
+    return {"status": True, "message": "Success", "data": load_profile(profile_id)}
+
+
+@router.get("/profiles/{profile_id}/folded")
+async def get_profile_stacks(profile_id: str):
+    """Endpoint returning the stacks of a profile in the folded flamegraph format"""
+    content = "\n".join(load_profile(profile_id)["stacks"]) + "\n"
+
+    return Response(content=content, media_type="text/plain")
@@ -1,49 +1,75 @@
 """Endpoints for authentication"""
+from datetime import timedelta
 from typing import Annotated, Union
-from datetime import datetime, timedelta
-from fastapi import APIRouter, Cookie, HTTPException, Response, Depends, status
-from fastapi.responses import JSONResponse
-from redis import Redis
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Cookie, HTTPException, Request, Response, Depends, status
+from fastapi.responses import ORJSONResponse
+from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 from app.db.connection import get_db
-from app.schemas.response_result import ResponseResult
+from app.errors import TokenDecodingException, TokenExpiredException
+from app.schemas.introspection import IntrospectRequest, TokenIntrospection
+from app.schemas.response_result import (
+    IntrospectionResult,
+    ResponseResult,
+    TokenPairResult,
+    UserResult,
+    UserSessionsResult,
+    UuidResult,
+)
 from app.schemas.user import UserCreate, UserSignIn
-from app.schemas.usertoken import UserTokenCreate
+from app.schemas.usertoken import UserSession, UserTokenCreate
 from app.services.blocklist import BlockListService
+from app.services.throttle import LoginThrottleService
 from app.services.usertoken import UserTokenService
 from app.utils.settings import settings
 from app.utils.auth import (
+    access_token_issued_at,
+    decode_user_claims,
     decode_user_uuid,
     get_access_token,
     get_access_token_user_uuid,
 )
-from app.utils.jwt import create_user_tokens
+from app.utils.jwt import (
+    create_user_tokens,
+    decode_token_payload,
+    get_access_token_secret,
+    token_digest,
+)
 from app.utils.redis import get_redis
+from app.utils.response import success_response
 from app.services.user import UserService
 
 router = APIRouter()
 
 
-@router.post("/register", response_model=ResponseResult)
-def register_user(user: UserCreate, db: Session = Depends(get_db)):
+@router.post("/register", response_model=UserResult)
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
     """Endpoint for registering a new user"""
     user_service = UserService(db)
 
-    result_user = user_service.create_user(user)
+    result_user = await user_service.create_user(user)
     return {"status": True, "message": "Success", "data": result_user}
 
 
-@router.post("/login", response_model=ResponseResult)
-def login_user(
+@router.post("/login", response_model=TokenPairResult)
+async def login_user(
     user_signin: UserSignIn,
+    request: Request,
     response: Response,
     refresh_token: Annotated[Union[str, None], Cookie()] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
+    redis: Redis = Depends(get_redis),
 ):
     """Endpoint for performing a username/password login"""
-    user_service = UserService(db)
+    user_service = UserService(db, redis)
     usertoken_service = UserTokenService(db)
+    throttle_service = LoginThrottleService(redis)
+
+    # banned users and IPs are refused before spending any time on password hashing;
+    # behind a proxy, the client address comes from the trusted X-Forwarded-For header
+    client_ip = request.client.host if request.client else None
+    await throttle_service.check_attempt(user_signin.username, client_ip)
 
     try:
         # in case the sign-in is receiving an existing refresh_token cookie...
@@ -53,14 +79,17 @@ def login_user(
                 refresh_token, settings.refresh_token_private_key
             )
 
-            user_token = usertoken_service.find_usertoken(refresh_token)
+            user_token = await usertoken_service.find_usertoken(refresh_token)
 
             # if the refresh token doesn't exist in the database, it means that someone
             # else rotated it! So, let's clear all valid refresh tokens
             if user_token is None:
-                usertoken_service.remove_all_user_tokens_by_uuid(user_uuid)
+                await usertoken_service.remove_all_user_tokens_by_uuid(user_uuid)
+                await user_service.revoke_access_tokens(user_uuid)
             else:
-                usertoken_service.remove_user_token_by_token(user_token.refresh_token)
+                await usertoken_service.remove_user_token_by_token(
+                    user_token.refresh_token
+                )
 
             response.delete_cookie(key="refresh_token")
     except HTTPException:
@@ -68,7 +97,14 @@ def login_user(
     except SQLAlchemyError:
         pass  # ignore errors when querying or deleting usertoken entries and continue the login
 
-    user_uuid = user_service.signin(user_signin)
+    try:
+        user_uuid = await user_service.signin(user_signin)
+    except HTTPException as err:
+        if err.status_code == status.HTTP_401_UNAUTHORIZED:
+            await throttle_service.register_failure(user_signin.username, client_ip)
+        raise
+
+    await throttle_service.register_success(user_signin.username)
 
     tokens = create_user_tokens(user_uuid)
     new_refresh_token = tokens["refresh_token"]
@@ -82,79 +118,157 @@ def login_user(
         secure=True,
     )
 
-    usertoken_service.insert_user_token(
+    await usertoken_service.insert_user_token(
         UserTokenCreate(uuid=user_uuid, refresh_token=new_refresh_token)
     )
 
     return {"status": True, "message": "Success", "data": tokens}
 
 
-@router.post("/refresh", response_model=ResponseResult)
-def refresh_tokens(
-    response: Response,
+@router.post("/refresh", response_model=TokenPairResult)
+async def refresh_tokens(
     refresh_token: Annotated[Union[str, None], Cookie()] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
+    redis: Redis = Depends(get_redis),
 ):
     """Endpoint for refreshing an expired access token"""
-    user_service = UserService(db)
-    usertoken_service = UserTokenService(db)
+    user_service = UserService(db, redis)
 
-    user_uuid = user_service.refresh_user_token(refresh_token)
+    # the refresh token is rotated, so the current one is replaced by a new one
+    tokens = await user_service.refresh_user_token(refresh_token)
 
-    # let's delete the refresh token to rotate it
+    # the tokens are plain strings, so the response is serialised directly
+    response = success_response(tokens)
     response.delete_cookie(key="refresh_token")
 
-    tokens = create_user_tokens(user_uuid)
-
-    new_refresh_token = tokens["refresh_token"]
-
-    usertoken_service.insert_user_token(
-        UserTokenCreate(uuid=user_uuid, refresh_token=new_refresh_token)
-    )
-
     response.set_cookie(
         key="refresh_token",
-        value=new_refresh_token,
+        value=tokens["refresh_token"],
         expires=settings.refresh_token_expiration * 60,
         httponly=True,
         samesite="lax",
         secure=True,
     )
 
-    return {"status": True, "message": "Success", "data": tokens}
+    return response
 
 
-@router.get("/auth/test", response_model=ResponseResult)
-def test_api(
+@router.get("/auth/test", response_model=UuidResult)
+async def test_api(
     user_uuid: Annotated[str, Depends(get_access_token_user_uuid)],
 ):
     """Protected test endpoint that only allows access using a valid access token"""
 
-    return {"status": True, "message": "Success", "data": user_uuid}
+    return success_response(user_uuid)
+
+
+@router.get("/sessions", response_model=UserSessionsResult)
+async def list_sessions(
+    user_uuid: Annotated[str, Depends(get_access_token_user_uuid)],
+    refresh_token: Annotated[Union[str, None], Cookie()] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """Endpoint listing the active sessions (refresh tokens) of the current user"""
+    usertoken_service = UserTokenService(db)
+
+    current_hash = token_digest(refresh_token) if refresh_token else None
+    lifetime = timedelta(minutes=settings.refresh_token_expiration)
+
+    sessions = [
+        UserSession(
+            id=token_hash[:16],
+            created_at=created_at,
+            expires_at=created_at + lifetime,
+            current=token_hash == current_hash,
+        )
+        for token_hash, created_at in await usertoken_service.find_user_sessions(user_uuid)
+    ]
+
+    return {"status": True, "message": "Success", "data": sessions}
+
+
+@router.post("/introspect", response_model=IntrospectionResult)
+async def introspect_tokens(
+    introspect_request: IntrospectRequest,
+    redis: Redis = Depends(get_redis),
+):
+    """Endpoint for validating a batch of access tokens at once"""
+    blocklist_service = BlockListService(redis)
+    secret = get_access_token_secret()
+
+    results = []
+    valid = []
+    for i, token in enumerate(introspect_request.tokens):
+        try:
+            claims = decode_user_claims(token, secret)
+            results.append(
+                TokenIntrospection(active=True, status="active", sub=claims.sub, exp=claims.exp)
+            )
+            valid.append((i, (token, claims.sub, access_token_issued_at(claims))))
+        except HTTPException as err:
+            token_status = "expired" if err.status_code == status.HTTP_403_FORBIDDEN else "invalid"
+            results.append(TokenIntrospection(active=False, status=token_status))
+
+    # only the valid tokens need to be checked against the block list
+    revoked = await blocklist_service.are_tokens_revoked([claims for _, claims in valid])
+
+    for (i, _), is_revoked in zip(valid, revoked):
+        if is_revoked:
+            results[i] = TokenIntrospection(active=False, status="revoked")
+
+    return {"status": True, "message": "Success", "data": results}
 
 
 @router.post("/logout", response_model=ResponseResult)
-def logout_user(
+async def logout_user(
     refresh_token: Annotated[Union[str, None], Cookie()] = None,
     access_token: Union[str, None] = Depends(get_access_token),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     redis: Redis = Depends(get_redis),
 ):
     """Endpoint to logout user"""
     usertoken_service = UserTokenService(db)
     blocklist_service = BlockListService(redis)
 
-    usertoken_service.remove_user_token_by_token(refresh_token)
+    await usertoken_service.remove_user_token_by_token(refresh_token)
 
     if access_token:
-        blocklist_service.add_token_to_blocklist(
-            access_token,
-            datetime.now() + timedelta(minutes=settings.access_token_expiration),
-        )
+        try:
+            payload = decode_token_payload(access_token, get_access_token_secret())
+            await blocklist_service.add_token_to_blocklist(access_token, payload["exp"])
+        except (KeyError, TokenDecodingException, TokenExpiredException):
+            pass  # invalid or expired tokens are already refused, no need to block them
+
+    headers = {"Location": "/"}
+    content = {"status": True, "message": "Successful Logout! 🛫", "data": None}
+    response = ORJSONResponse(
+        content=content,
+        headers=headers,
+        status_code=status.HTTP_307_TEMPORARY_REDIRECT,
+    )
+
+    response.delete_cookie(key="refresh_token")
+
+    return response
+
+
+@router.post("/logout/all", response_model=ResponseResult)
+async def logout_user_everywhere(
+    user_uuid: Annotated[str, Depends(get_access_token_user_uuid)],
+    db: AsyncSession = Depends(get_db),
+    redis: Redis = Depends(get_redis),
+):
+    """Endpoint to logout user from every device"""
+    usertoken_service = UserTokenService(db)
+    blocklist_service = BlockListService(redis)
+
+    # a single watermark revokes every access token issued until now
+    await usertoken_service.remove_all_user_tokens_by_uuid(user_uuid)
+    await blocklist_service.revoke_user_tokens(user_uuid)
 
     headers = {"Location": "/"}
     content = {"status": True, "message": "Successful Logout! 🛫", "data": None}
-    response = JSONResponse(
+    response = ORJSONResponse(
         content=content,
         headers=headers,
         status_code=status.HTTP_307_TEMPORARY_REDIRECT,
@@ -0,0 +1,20 @@
+"""Endpoint publishing the access token verification keys"""
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.utils.jwt import get_access_token_secret
+from app.utils.keys import KeyRing
+from app.utils.settings import settings
+
+router = APIRouter()
+
+
+@router.get("/.well-known/jwks.json")
+async def get_jwks():
+    """Endpoint returning the JSON Web Key Set used to verify the access tokens"""
+    secret = get_access_token_secret()
+    jwks = secret.jwks() if isinstance(secret, KeyRing) else {"keys": []}
+
+    return JSONResponse(
+        content=jwks,
+        headers={"Cache-Control": f"public, max-age={settings.jwks_max_age}"},
+    )
@@ -0,0 +1,13 @@
+"""Endpoint exposing the Prometheus metrics"""
+from fastapi import APIRouter, Response
+from app.utils.metrics import render_metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Endpoint returning the metrics in the Prometheus text format"""
+    content, content_type = render_metrics()
+
+    return Response(content=content, headers={"Content-Type": content_type})
@@ -0,0 +1,20 @@
+"""Pydantic token introspection schema classes"""
+from typing import List, Optional
+from pydantic import BaseModel, Field
+from app.utils.settings import settings
+
+
+class IntrospectRequest(BaseModel):
+    """Introspection request schema class with the batch of access tokens to validate"""
+
+    tokens: List[str] = Field(max_length=settings.introspect_max_tokens)
+
+
+class TokenIntrospection(BaseModel):
+    """Introspection result schema class of a single token"""
+
+    active: bool
+    # "active", "invalid", "expired" or "revoked"
+    status: str
+    sub: Optional[str] = None
+    exp: Optional[int] = None
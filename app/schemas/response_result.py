@@ -1,6 +1,9 @@
 """Data format for the API responses"""
-from typing import Union, Any
+from typing import Union, Any, List
 from pydantic import BaseModel
+from app.schemas.introspection import TokenIntrospection
+from app.schemas.user import User, UserImportSummary
+from app.schemas.usertoken import TokenPair, UserSession
 
 
 class ResponseResult(BaseModel):
@@ -9,3 +12,39 @@ class ResponseResult(BaseModel):
     status: bool
     message: str
     data: Union[Any, None] = None
+
+
+class TokenPairResult(ResponseResult):
+    """Response format carrying a new access/refresh token pair"""
+
+    data: TokenPair
+
+
+class UserResult(ResponseResult):
+    """Response format carrying a user record"""
+
+    data: User
+
+
+class UuidResult(ResponseResult):
+    """Response format carrying a user UUID"""
+
+    data: str
+
+
+class IntrospectionResult(ResponseResult):
+    """Response format carrying the introspection result of each token"""
+
+    data: List[TokenIntrospection]
+
+
+class UserImportResult(ResponseResult):
+    """Response format carrying the summary of a bulk user import"""
+
+    data: UserImportSummary
+
+
+class UserSessionsResult(ResponseResult):
+    """Response format carrying the active sessions of a user"""
+
+    data: List[UserSession]
@@ -1,5 +1,6 @@
 """Pydantic user authentication schema classes"""
 from datetime import datetime
+from typing import List, Optional
 from pydantic import BaseModel
 
 
@@ -20,3 +21,20 @@ class User(UserBase):
     uuid: str
     name: str
     created_at: datetime
+
+class UserImport(UserBase):
+    """User import schema class, with either a plain password or an existing hash"""
+    name: str
+    password: Optional[str] = None
+    password_hash: Optional[str] = None
+
+class UserImportFailure(BaseModel):
+    """User import failure schema class reporting a rejected input line"""
+    line: int
+    username: Optional[str] = None
+    detail: str
+
+class UserImportSummary(BaseModel):
+    """User import summary schema class with the imported count and the rejected lines"""
+    imported: int = 0
+    failures: List[UserImportFailure] = []
@@ -14,3 +14,19 @@ class UserToken(UserTokenCreate):
     """UserToken schema class for retrieving the user uuid and its token"""
 
     created_at: datetime
+
+
+class TokenPair(BaseModel):
+    """Access and refresh token pair schema class returned after a login or refresh"""
+
+    access_token: str
+    refresh_token: str
+
+
+class UserSession(BaseModel):
+    """Active session schema class, identified by a prefix of its refresh token digest"""
+
+    id: str
+    created_at: datetime
+    expires_at: datetime
+    current: bool = False
@@ -0,0 +1,97 @@
+"""Production server running the API in several preforked worker processes
+
+The application is imported once in the master process (preload), so its
+import cost is paid a single time and the memory pages are shared by the
+workers after the fork. Each worker then runs the lifespan startup, which
+warms up its connections, keys and password hashing processes before it
+accepts any request.
+
+On SIGTERM, or on SIGHUP to replace the workers, each worker stops
+accepting connections and is given SERVER_GRACEFUL_TIMEOUT seconds to
+finish its in-flight requests. As the code is preloaded, deploying new code
+requires restarting the master (or a USR2 + WINCH upgrade).
+
+    python -m app.server
+"""
+import os
+import tempfile
+from pathlib import Path
+from gunicorn.app.base import BaseApplication
+from app.utils.settings import settings
+
+WORKER_CLASS = "uvicorn.workers.UvicornWorker"
+
+
+def available_cores():
+    """Function returning the number of cores this process is allowed to run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+
+    return os.cpu_count() or 1
+
+
+def prepare_metrics_dir():
+    """Function pointing the metrics of every worker to a shared, empty directory"""
+    metrics_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+    if metrics_dir is None:
+        metrics_dir = tempfile.mkdtemp(prefix="fastapi-auth-metrics-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+
+    # values left by a previous run would be added to the new ones
+    for path in Path(metrics_dir).glob("*.db"):
+        path.unlink()
+
+
+def child_exit(_server, worker):
+    """Gunicorn hook releasing the metrics of a worker that exited"""
+    from app.utils.metrics import mark_process_dead  # pylint: disable=import-outside-toplevel
+
+    mark_process_dead(worker.pid)
+
+
+class Server(BaseApplication):  # pylint: disable=abstract-method
+    """Gunicorn application serving the preloaded API with uvicorn workers"""
+
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from app.main import app  # pylint: disable=import-outside-toplevel
+
+        return app
+
+
+def run():
+    """Size the workers to the available cores and start serving"""
+    cores = available_cores()
+    workers = settings.server_workers or cores
+
+    # every worker owns a password hashing pool, they share the cores between them
+    if settings.password_hash_workers == 0:
+        settings.password_hash_workers = max(cores // workers, 1)
+
+    if workers > 1:
+        prepare_metrics_dir()
+
+    Server(
+        {
+            "bind": f"{settings.server_host}:{settings.server_port}",
+            "workers": workers,
+            "worker_class": WORKER_CLASS,
+            "preload_app": True,
+            "graceful_timeout": settings.server_graceful_timeout,
+            "keepalive": settings.server_keepalive,
+            "forwarded_allow_ips": settings.forwarded_allow_ips,
+            "child_exit": child_exit,
+        }
+    ).run()
+
+
+if __name__ == "__main__":
+    run()
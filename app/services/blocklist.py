@@ -5,9 +5,398 @@ interesting to create a common interface
 to handle with Redis without using directly
 Redis package, but for this test project
 it's fine.
+
+Logouts are rare compared to token checks, so each worker can optionally
+keep a local mirror of the blocked (and not yet expired) token digests and
+answer the common "not blocked" case without a Redis round trip. The mirror
+is warmed with a SCAN after subscribing to the block list channel, and it
+only answers while the subscription is alive and recently heard from;
+otherwise the service falls back to querying Redis directly.
+
+Entries are stored as "bl:<sha256 of the token>" with a one byte value and
+expire exactly when the token does. Entries written by older releases as
+"bl_<token>" are still honoured while BLOCKLIST_LEGACY_KEYS is enabled; they
+disappear by themselves after one access token lifetime.
+
+Revoking every token of a user is a single "nb:<uuid>" key holding a
+not-before watermark in milliseconds: access tokens issued before it are
+refused, while the ones issued right after (as by a new login) are not. The key
+lives for one access token lifetime, after which every token it covers has
+expired anyway. Workers cache the watermarks shortly (or keep them in the
+mirror, published on the same channel as the blocked digests).
+
+Redis calls go through a circuit breaker, and the checks have a latency
+budget (BLOCKLIST_CHECK_TIMEOUT). When Redis fails, is too slow or the
+circuit is open, a check is answered from the revocations this worker
+knows of: its own logouts and the ones it recently read from Redis (plus
+the mirror entries, even when stale). Tokens unknown to them are accepted or
+refused according to BLOCKLIST_FAILURE_POLICY. Writes that could not reach
+Redis are queued and replayed by a background task once it is back.
+"""
+import asyncio
+import itertools
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+from fastapi import HTTPException, status
+from redis.asyncio import ConnectionPool, Redis
+from redis.exceptions import RedisError
+from app.errors import ServiceUnavailableException
+from app.utils.jwt import token_digest
+from app.utils.metrics import timed
+from app.utils.redis import redis_breaker
+from app.utils.settings import settings
+from app.utils.token_cache import verified_token_cache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "bl:"
+LEGACY_KEY_PREFIX = "bl_"
+WATERMARK_KEY_PREFIX = "nb:"
+MIRROR_PING_MESSAGE = "blocklist-mirror"
+WRITE_REPLAY_INTERVAL = 1.0
+WRITE_REPLAY_BATCH_SIZE = 500
+
+# Sets a watermark unless a newer one is already stored, so a replayed
+# revocation never lowers the watermark written meanwhile by another worker.
+#
+# KEYS: watermark key
+# ARGV: watermark, expiration timestamp
+SET_WATERMARK_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+if tonumber(ARGV[1]) > current then
+    redis.call('SET', KEYS[1], ARGV[1], 'EXAT', ARGV[2])
+end
+return 0
 """
-from datetime import datetime
-from redis import Redis
+
+
+def access_token_lifetime():
+    """Function returning the lifetime of the access tokens in seconds"""
+    return settings.access_token_expiration * 60
+
+
+class WatermarkCache:
+    """Bounded LRU cache of the user watermarks read from Redis, 0 meaning no watermark"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+
+    def get(self, uuid: str) -> Optional[int]:
+        """Return the cached watermark of an user, or None when it must be read again"""
+        entry = self._entries.get(uuid)
+
+        if entry is None:
+            return None
+
+        if entry[1] <= time.monotonic():
+            del self._entries[uuid]
+            return None
+
+        self._entries.move_to_end(uuid)
+        return entry[0]
+
+    def put(self, uuid: str, watermark: int):
+        """Store the watermark of an user"""
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+
+        self._entries[uuid] = (watermark, time.monotonic() + self.ttl)
+        self._entries.move_to_end(uuid)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+watermark_cache = WatermarkCache(settings.jwt_cache_size, settings.token_watermark_cache_ttl)
+
+
+class RecentRevocations:
+    """Bounded LRU cache of the blocked digests and watermarks known to a worker
+
+    It answers the token checks while Redis is unavailable. Entries are
+    ignored once the tokens they cover have expired, and evicted by newer
+    ones past max_size.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._digests: "OrderedDict[str, float]" = OrderedDict()
+        self._watermarks: "OrderedDict[str, int]" = OrderedDict()
+
+    @staticmethod
+    def _put(entries: OrderedDict, key: str, value, max_size: int):
+        entries[key] = value
+        entries.move_to_end(key)
+
+        while len(entries) > max_size:
+            entries.popitem(last=False)
+
+    def add(self, digest: str, exp: float):
+        """Register a blocked token digest until its expiration timestamp"""
+        if self.max_size > 0:
+            self._put(self._digests, digest, exp, self.max_size)
+
+    def set_watermark(self, uuid: str, watermark: int):
+        """Register the not-before watermark of an user"""
+        if self.max_size > 0 and watermark > self._watermarks.get(uuid, 0):
+            self._put(self._watermarks, uuid, watermark, self.max_size)
+
+    def contains(self, digest: str):
+        """Check if a token digest is known to be blocked"""
+        exp = self._digests.get(digest)
+        return exp is not None and exp > time.time()
+
+    def watermark(self, uuid: str) -> int:
+        """Return the known not-before watermark of an user, 0 when there is none"""
+        watermark = self._watermarks.get(uuid, 0)
+        return watermark if watermark > (time.time() - access_token_lifetime()) * 1000 else 0
+
+
+recent_revocations = RecentRevocations(settings.blocklist_recent_cache_size)
+
+
+class BlockListMirror:
+    """Block list mirror class holding the blocked token digests of a worker"""
+
+    def __init__(self, channel: str, max_lag: float):
+        self.channel = channel
+        self.max_lag = max_lag
+        self._entries: Dict[str, float] = {}
+        self._watermarks: Dict[str, int] = {}
+        self._connected = False
+        self._last_seen = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_synced(self):
+        """Whether the mirror is subscribed and heard from Redis recently enough"""
+        return self._connected and time.monotonic() - self._last_seen <= self.max_lag
+
+    def add(self, digest: str, exp: float):
+        """Register a blocked token digest until its expiration timestamp"""
+        self._entries[digest] = exp
+
+    def contains(self, digest: str):
+        """Check if a token digest is currently blocked"""
+        exp = self._entries.get(digest)
+
+        if exp is None:
+            return False
+
+        if exp <= time.time():
+            self._entries.pop(digest, None)
+            return False
+
+        return True
+
+    def set_watermark(self, uuid: str, watermark: int):
+        """Register the not-before watermark of an user"""
+        self._watermarks[uuid] = max(watermark, self._watermarks.get(uuid, 0))
+
+    def watermark(self, uuid: str) -> int:
+        """Return the not-before watermark of an user, 0 when there is none"""
+        return self._watermarks.get(uuid, 0)
+
+    def prune(self):
+        """Drop every entry whose token has already expired"""
+        now = time.time()
+        for digest in [d for d, exp in self._entries.items() if exp <= now]:
+            del self._entries[digest]
+
+        issued_after = (now - access_token_lifetime()) * 1000
+        for uuid in [u for u, mark in self._watermarks.items() if mark <= issued_after]:
+            del self._watermarks[uuid]
+
+    def start(self, pool: ConnectionPool):
+        """Start the background task that keeps the mirror in sync"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(pool))
+
+    async def stop(self):
+        """Stop the background synchronization task"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._connected = False
+
+    async def _run(self, pool: ConnectionPool):
+        """Keep (re)subscribing to the block list channel until cancelled"""
+        while True:
+            try:
+                await self._sync(Redis(connection_pool=pool))
+            except (RedisError, OSError) as err:
+                logger.warning("Block list mirror disconnected, resubscribing: %s", err)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Block list mirror failed, resubscribing")
+            finally:
+                self._connected = False
+
+            await asyncio.sleep(1)
+
+    async def _sync(self, redis: Redis):
+        """Subscribe, warm the mirror from Redis and apply the published updates"""
+        async with redis.pubsub() as pubsub:
+            # subscribing before warming up ensures no logout is missed in between
+            await pubsub.subscribe(self.channel)
+            blocklist_service = BlockListService(redis)
+            self._entries = await blocklist_service.load_blocked_digests()
+            self._watermarks = await blocklist_service.load_watermarks()
+
+            self._connected = True
+            self._last_seen = time.monotonic()
+            last_ping = self._last_seen
+
+            while True:
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=1.0
+                )
+                now = time.monotonic()
+
+                if message is not None:
+                    self._last_seen = now
+                    if message["type"] == "message":
+                        key, value = message["data"].split(" ")
+                        if key.startswith(WATERMARK_KEY_PREFIX):
+                            self.set_watermark(key[len(WATERMARK_KEY_PREFIX):], int(value))
+                        else:
+                            self.add(key, float(value))
+
+                if now - last_ping >= self.max_lag / 2:
+                    await pubsub.ping(MIRROR_PING_MESSAGE)
+                    last_ping = now
+                    self.prune()
+
+
+blocklist_mirror = BlockListMirror(
+    settings.blocklist_channel, settings.blocklist_mirror_max_lag
+)
+
+
+class BlockListWriteQueue:
+    """Bounded queue of the block list writes that could not reach Redis
+
+    Each write is a (key, value, expiration timestamp) tuple, key being the
+    blocked digest or the "nb:<uuid>" watermark key, as published on the
+    block list channel. A background task replays them through the circuit
+    breaker once Redis answers again, oldest first; the writes whose tokens
+    have expired meanwhile are dropped.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._writes: Deque[Tuple[str, int, int]] = deque()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self._writes)
+
+    def add(self, key: str, value: int, exp: int):
+        """Queue a write, dropping the oldest one when the queue is full"""
+        if self.max_size <= 0:
+            return
+
+        if len(self._writes) >= self.max_size:
+            dropped_key, _, _ = self._writes.popleft()
+            logger.warning("Block list write queue full, dropping the write of %s", dropped_key)
+
+        self._writes.append((key, value, exp))
+
+    async def replay(self, redis: Redis):
+        """Write the queued entries to Redis, removing them once stored"""
+        set_watermark = redis.register_script(SET_WATERMARK_SCRIPT)
+
+        while self._writes:
+            batch = list(itertools.islice(self._writes, WRITE_REPLAY_BATCH_SIZE))
+            now = time.time()
+
+            async with redis.pipeline(transaction=False) as pipe:
+                for key, value, exp in batch:
+                    if exp <= now:
+                        continue
+                    if key.startswith(WATERMARK_KEY_PREFIX):
+                        await set_watermark(keys=[key], args=[value, exp], client=pipe)
+                    else:
+                        pipe.set(f"{KEY_PREFIX}{key}", 1, exat=exp)
+                    pipe.publish(settings.blocklist_channel, f"{key} {value}")
+                await pipe.execute()
+
+            for _ in batch:
+                self._writes.popleft()
+
+    def start(self, pool: ConnectionPool):
+        """Start the background task replaying the queued writes"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(pool))
+
+    async def stop(self):
+        """Stop the background replay task"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, pool: ConnectionPool):
+        """Replay the queued writes every interval until cancelled"""
+        redis = Redis(connection_pool=pool)
+        try:
+            while True:
+                await asyncio.sleep(WRITE_REPLAY_INTERVAL)
+                if not self._writes:
+                    continue
+
+                try:
+                    await redis_breaker.call(self.replay, redis)
+                    logger.info("Block list writes replayed")
+                except ServiceUnavailableException:
+                    pass
+                except Exception:  # pylint: disable=broad-except
+                    # the queued writes are kept and retried on the next interval
+                    logger.exception("Block list write replay failed")
+        finally:
+            await redis.aclose()
+
+
+blocklist_write_queue = BlockListWriteQueue(settings.blocklist_write_queue_size)
+
+
+def check_timeout():
+    """Function returning the latency budget of a block list check in seconds"""
+    return settings.blocklist_check_timeout / 1000 if settings.blocklist_check_timeout else None
+
+
+def known_revoked(digest: str, uuid: str, issued_at: int):
+    """Function checking a token against the revocations known locally, for the degraded mode
+
+    Unknown tokens are accepted by the "open" failure policy and refused
+    with a 503 by the "closed" one.
+    """
+    if recent_revocations.contains(digest) or blocklist_mirror.contains(digest):
+        return True
+
+    if issued_at < max(recent_revocations.watermark(uuid), blocklist_mirror.watermark(uuid)):
+        return True
+
+    if settings.blocklist_failure_policy == "closed":
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Token revocation status unavailable, please try again later",
+            headers={"Retry-After": str(math.ceil(settings.redis_breaker_reset_timeout))},
+        )
+
+    return False
+
 
 class BlockListService:
     """Block list service class"""
@@ -15,15 +404,177 @@ class BlockListService:
     def __init__(self, redis: Redis):
         self.redis = redis
 
-    def add_token_to_blocklist(self, token: str, exp: datetime):
-        """Function used to add a new token in the block list during and an expiration time"""
-        token_key = f"bl_{token}"
-        self.redis.set(token_key, token)
-        self.redis.expireat(token_key, exp)
+    @timed("blocklist_add_token_to_blocklist")
+    async def add_token_to_blocklist(self, token: str, exp: int):
+        """Function used to add a new token in the block list until its expiration timestamp"""
+        digest = token_digest(token)
+
+        async def write():
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.set(f"{KEY_PREFIX}{digest}", 1, exat=exp)
+                pipe.publish(settings.blocklist_channel, f"{digest} {exp}")
+                await pipe.execute()
+
+        verified_token_cache.invalidate(token)
+        blocklist_mirror.add(digest, exp)
+        recent_revocations.add(digest, exp)
+
+        try:
+            await redis_breaker.call(write)
+        except ServiceUnavailableException as err:
+            logger.warning("Block list unavailable, queueing the logout: %s", err)
+            blocklist_write_queue.add(digest, exp, exp)
+
+    @timed("blocklist_revoke_user_tokens")
+    async def revoke_user_tokens(self, uuid: str):
+        """Function used to revoke every access token issued to an user until now"""
+        watermark = int(time.time() * 1000)
+        key = f"{WATERMARK_KEY_PREFIX}{uuid}"
+        exp = watermark // 1000 + access_token_lifetime() + 1
+
+        async def write():
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.set(key, watermark, exat=exp)
+                pipe.publish(settings.blocklist_channel, f"{key} {watermark}")
+                await pipe.execute()
+
+        watermark_cache.put(uuid, watermark)
+        blocklist_mirror.set_watermark(uuid, watermark)
+        recent_revocations.set_watermark(uuid, watermark)
+
+        try:
+            await redis_breaker.call(write)
+        except ServiceUnavailableException as err:
+            logger.warning("Block list unavailable, queueing the revocation of %s: %s", uuid, err)
+            blocklist_write_queue.add(key, watermark, exp)
+
+    @timed("blocklist_is_token_revoked")
+    async def is_token_revoked(self, token: str, uuid: str, issued_at: int):
+        """Function to check if a token is blocked or was issued before its user watermark"""
+        digest = token_digest(token)
+
+        if settings.blocklist_mirror and blocklist_mirror.is_synced:
+            return (
+                blocklist_mirror.contains(digest)
+                or issued_at < blocklist_mirror.watermark(uuid)
+            )
+
+        keys = [f"{KEY_PREFIX}{digest}"]
+        if settings.blocklist_legacy_keys:
+            keys.append(f"{LEGACY_KEY_PREFIX}{token}")
+
+        watermark = watermark_cache.get(uuid)
+
+        async def query():
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.exists(*keys)
+                if watermark is None:
+                    pipe.get(f"{WATERMARK_KEY_PREFIX}{uuid}")
+                return await pipe.execute()
+
+        try:
+            results = await redis_breaker.call(query, timeout=check_timeout())
+        except ServiceUnavailableException:
+            return known_revoked(digest, uuid, issued_at)
+
+        if watermark is None:
+            watermark = int(results[1] or 0)
+            watermark_cache.put(uuid, watermark)
+            recent_revocations.set_watermark(uuid, watermark)
+
+        if results[0]:
+            recent_revocations.add(digest, time.time() + access_token_lifetime())
+
+        return bool(results[0]) or issued_at < watermark
+
+    @timed("blocklist_are_tokens_revoked")
+    async def are_tokens_revoked(self, tokens: List[Tuple[str, str, int]]) -> List[bool]:
+        """Function to check a batch of (token, uuid, issued at) in one round trip"""
+        digests = [token_digest(token) for token, _, _ in tokens]
+
+        if settings.blocklist_mirror and blocklist_mirror.is_synced:
+            return [
+                blocklist_mirror.contains(digest)
+                or issued_at < blocklist_mirror.watermark(uuid)
+                for digest, (_, uuid, issued_at) in zip(digests, tokens)
+            ]
+
+        if not tokens:
+            return []
+
+        count = len(tokens)
+        keys = [f"{KEY_PREFIX}{digest}" for digest in digests]
+        keys += [f"{WATERMARK_KEY_PREFIX}{uuid}" for _, uuid, _ in tokens]
+        if settings.blocklist_legacy_keys:
+            keys += [f"{LEGACY_KEY_PREFIX}{token}" for token, _, _ in tokens]
+
+        try:
+            values = await redis_breaker.call(self.redis.mget, keys, timeout=check_timeout())
+        except ServiceUnavailableException:
+            return [
+                known_revoked(digest, uuid, issued_at)
+                for digest, (_, uuid, issued_at) in zip(digests, tokens)
+            ]
+
+        blocked = [value is not None for value in values[:count]]
+        watermarks = [int(value or 0) for value in values[count:count * 2]]
+
+        if settings.blocklist_legacy_keys:
+            blocked = [
+                current or legacy is not None
+                for current, legacy in zip(blocked, values[count * 2:])
+            ]
+
+        return [
+            is_blocked or issued_at < watermark
+            for is_blocked, watermark, (_, _, issued_at) in zip(blocked, watermarks, tokens)
+        ]
+
+    async def load_blocked_digests(self):
+        """Function returning the digest and expiration of every blocked token"""
+        digests = {}
+        digests.update(await self._load_digests(KEY_PREFIX, lambda key: key))
+
+        if settings.blocklist_legacy_keys:
+            digests.update(await self._load_digests(LEGACY_KEY_PREFIX, token_digest))
+
+        return digests
+
+    async def load_watermarks(self):
+        """Function returning the not-before watermark of every user that has one"""
+        keys = [
+            key
+            async for key in self.redis.scan_iter(
+                match=f"{WATERMARK_KEY_PREFIX}*", count=1000
+            )
+        ]
+        watermarks = {}
+
+        for start in range(0, len(keys), 1000):
+            batch = keys[start:start + 1000]
+            for key, value in zip(batch, await self.redis.mget(batch)):
+                if value is not None:
+                    watermarks[key[len(WATERMARK_KEY_PREFIX):]] = int(value)
+
+        return watermarks
+
+    async def _load_digests(self, prefix: str, to_digest):
+        """Scan the keys stored with a prefix and map their digests to expiration times"""
+        keys = [
+            key async for key in self.redis.scan_iter(match=f"{prefix}*", count=1000)
+        ]
+        now = time.time()
+        digests = {}
+
+        for start in range(0, len(keys), 1000):
+            batch = keys[start:start + 1000]
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key in batch:
+                    pipe.ttl(key)
+                ttls = await pipe.execute()
 
-    def is_token_blocked(self, token: str):
-        """Function to check if there's a token value in the block list"""
-        token_key = f"bl_{token}"
-        val = self.redis.get(token_key)
+            for key, ttl in zip(batch, ttls):
+                if ttl > 0:
+                    digests[to_digest(key[len(prefix):])] = now + ttl
 
-        return bool(val)
+        return digests
@@ -0,0 +1,92 @@
+"""Background maintenance task removing expired refresh tokens
+
+Refresh tokens that simply expire are never presented again, so their
+user_token rows would otherwise stay forever. The sweeper deletes them in
+small batches, pausing between batches so it never holds the write lock for
+long. It runs inside the application lifespan when TOKEN_SWEEPER_ENABLED is
+set, or once from the command line:
+
+    python -m app.services.sweeper
+"""
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import NamedTuple
+from app.db.connection import dispose_engine, open_session
+from app.services.usertoken import UserTokenService
+from app.utils.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SweepResult(NamedTuple):
+    """Number of removed rows and the time a sweep took"""
+
+    removed: int
+    seconds: float
+
+
+async def sweep_expired_user_tokens(batch_size: int, batch_pause: float):
+    """Remove every refresh token older than the refresh token lifetime"""
+    created_before = datetime.utcnow() - timedelta(
+        minutes=settings.refresh_token_expiration
+    )
+    start = time.perf_counter()
+    removed = 0
+
+    while True:
+        async with open_session() as db:
+            batch_removed = await UserTokenService(db).remove_expired_user_tokens(
+                created_before, batch_size
+            )
+        removed += batch_removed
+
+        if batch_removed < batch_size:
+            break
+
+        await asyncio.sleep(batch_pause)
+
+    return SweepResult(removed, time.perf_counter() - start)
+
+
+async def run_sweeper(interval: float, batch_size: int, batch_pause: float):
+    """Sweep the expired refresh tokens periodically until cancelled"""
+    while True:
+        try:
+            result = await sweep_expired_user_tokens(batch_size, batch_pause)
+        except asyncio.CancelledError:
+            raise
+        except Exception:  # pylint: disable=broad-except
+            # whatever failed (locked database, driver or pool error), the next sweep retries
+            logger.exception("Token sweeper failed")
+        else:
+            logger.info(
+                "Token sweeper removed %d expired refresh tokens in %.3fs",
+                result.removed,
+                result.seconds,
+            )
+        await asyncio.sleep(interval)
+
+
+async def sweep_once(batch_size: int, batch_pause: float):
+    """Run a single sweep and release the database connections afterwards"""
+    try:
+        return await sweep_expired_user_tokens(batch_size, batch_pause)
+    finally:
+        await dispose_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Remove expired refresh tokens")
+    parser.add_argument(
+        "--batch-size", type=int, default=settings.token_sweeper_batch_size
+    )
+    parser.add_argument(
+        "--batch-pause", type=float, default=settings.token_sweeper_batch_pause
+    )
+    args = parser.parse_args()
+
+    sweep = asyncio.run(sweep_once(args.batch_size, args.batch_pause))
+    print(f"Removed {sweep.removed} expired refresh tokens in {sweep.seconds:.3f}s")
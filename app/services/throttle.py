@@ -0,0 +1,144 @@
+"""Service that throttles the failed login attempts per username and client IP
+
+A banned username or IP is refused before any password hashing is done.
+Only the failed attempts count toward the limits, so signing in repeatedly
+with the right password is never throttled, and a successful sign-in clears
+the failures of its username (but not of its IP, which may be trying other
+usernames).
+
+Redis calls go through the Redis circuit breaker, within the latency
+budget of the block list checks. While Redis is unavailable the attempts
+are let through at once (and counted as skipped): a broken limiter must not
+lock every user out.
+
+The client IP is the address uvicorn reports: behind a reverse proxy or a
+load balancer, its address must be listed in FORWARDED_ALLOW_IPS so the
+X-Forwarded-For header is honoured, otherwise every client shares the
+proxy's bucket.
+"""
+import time
+import uuid
+from typing import List, Optional
+from fastapi import HTTPException, status
+from redis.asyncio import Redis
+from app.errors import ServiceUnavailableException
+from app.services.blocklist import check_timeout
+from app.utils.metrics import LOGIN_THROTTLE_SKIPPED
+from app.utils.redis import redis_breaker
+from app.utils.settings import settings
+
+KEY_PREFIX = "lt:"
+
+CHECK_SKIPPED = LOGIN_THROTTLE_SKIPPED.labels("check")
+FAILURE_SKIPPED = LOGIN_THROTTLE_SKIPPED.labels("register_failure")
+SUCCESS_SKIPPED = LOGIN_THROTTLE_SKIPPED.labels("register_success")
+
+# Sliding window counting the failed attempts of the username and the client
+# IP in a single round trip. Each subject has a sorted set with the failure
+# timestamps inside the window, and a ban key created once the limit is
+# reached.
+#
+# KEYS: user window, user ban, ip window, ip ban
+# ARGV: now (ms), attempt id, then limit/window (ms)/ban (ms) for user and ip
+FAILURE_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local member = ARGV[2]
+
+for i = 0, 1 do
+    local window_key = KEYS[i * 2 + 1]
+    local limit = tonumber(ARGV[i * 3 + 3])
+    local window = tonumber(ARGV[i * 3 + 4])
+    local ban = tonumber(ARGV[i * 3 + 5])
+
+    redis.call('ZREMRANGEBYSCORE', window_key, '-inf', now - window)
+    redis.call('ZADD', window_key, now, member)
+    redis.call('PEXPIRE', window_key, window)
+
+    if redis.call('ZCARD', window_key) >= limit then
+        redis.call('SET', KEYS[i * 2 + 2], 1, 'PX', ban)
+        redis.call('DEL', window_key)
+    end
+end
+
+return 0
+"""
+
+
+def throttle_keys(username: str, client_ip: Optional[str]) -> List[str]:
+    """Function returning the window and ban keys of an username and a client IP"""
+    client_ip = client_ip or "unknown"
+    return [
+        f"{KEY_PREFIX}u:{username}",
+        f"{KEY_PREFIX}u:{username}:ban",
+        f"{KEY_PREFIX}ip:{client_ip}",
+        f"{KEY_PREFIX}ip:{client_ip}:ban",
+    ]
+
+
+class LoginThrottleService:
+    """Login throttle service class for limiting the failed sign-ins per username and IP"""
+
+    def __init__(self, redis: Redis):
+        self.redis = redis
+        self.script = redis.register_script(FAILURE_WINDOW_SCRIPT)
+
+    async def check_attempt(self, username: str, client_ip: Optional[str]):
+        """Check a login attempt use case method, raising 429 while the username or IP is banned"""
+        if not settings.login_throttle_enabled:
+            return
+
+        _, user_ban, _, ip_ban = throttle_keys(username, client_ip)
+
+        async def query():
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.pttl(user_ban)
+                pipe.pttl(ip_ban)
+                return await pipe.execute()
+
+        try:
+            retry_after_ms = max(await redis_breaker.call(query, timeout=check_timeout()))
+        except ServiceUnavailableException:
+            CHECK_SKIPPED.inc()
+            return
+
+        if retry_after_ms > 0:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many login attempts, please try again later",
+                headers={"Retry-After": str(-(-retry_after_ms // 1000))},
+            )
+
+    async def register_failure(self, username: str, client_ip: Optional[str]):
+        """Register a failed login use case method, banning the subjects reaching their limit"""
+        if not settings.login_throttle_enabled:
+            return
+
+        args = [
+            int(time.time() * 1000),
+            uuid.uuid4().hex,
+            settings.login_throttle_username_limit,
+            settings.login_throttle_username_window * 1000,
+            settings.login_throttle_username_ban * 1000,
+            settings.login_throttle_ip_limit,
+            settings.login_throttle_ip_window * 1000,
+            settings.login_throttle_ip_ban * 1000,
+        ]
+
+        try:
+            await redis_breaker.call(
+                self.script, throttle_keys(username, client_ip), args, timeout=check_timeout()
+            )
+        except ServiceUnavailableException:
+            FAILURE_SKIPPED.inc()
+
+    async def register_success(self, username: str):
+        """Register a successful login use case method, clearing the failures of the username"""
+        if not settings.login_throttle_enabled:
+            return
+
+        try:
+            await redis_breaker.call(
+                self.redis.delete, f"{KEY_PREFIX}u:{username}", timeout=check_timeout()
+            )
+        except ServiceUnavailableException:
+            SUCCESS_SKIPPED.inc()
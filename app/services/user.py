@@ -1,37 +1,86 @@
 """Service for handling user authentication tasks"""
+import asyncio
+import importlib
+import logging
+from datetime import datetime
+from typing import List, Optional, Set
 from fastapi import HTTPException, status
+from redis.asyncio import Redis
 
-from sqlalchemy.orm import Session
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError, NoResultFound, SQLAlchemyError
-from passlib.context import CryptContext
-from app.db.models import UserModel
-from app.schemas.user import UserCreate, User, UserSignIn
+from app.db.connection import open_session
+from app.db.models import UserModel, generate_uuid
+from app.errors import PasswordHasherBusyException
+from app.schemas.user import UserCreate, User, UserImport, UserSignIn
+from app.schemas.usertoken import UserTokenCreate
+from app.services.blocklist import BlockListService
 from app.services.usertoken import UserTokenService
 from app.utils.settings import settings
 from app.utils.auth import decode_user_uuid
+from app.utils.jwt import create_user_tokens
+from app.utils.metrics import REFRESH_TOKEN_REUSES
+from app.utils.password import password_hasher
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger(__name__)
+
+
+def hasher_busy_exception():
+    """Return the HTTP error used when the password hashing pool is saturated"""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server is busy, please try again later",
+        headers={"Retry-After": str(settings.password_hash_retry_after)},
+    )
+
+
+# dialects able to skip the conflicting rows of a multi-row INSERT
+CONFLICT_IGNORING_DIALECTS = ("sqlite", "postgresql")
+
+# references to the running rehash tasks, so they aren't garbage collected midway
+rehash_tasks: Set[asyncio.Task] = set()
+
+
+async def rehash_user_password(user_uuid: str, password: str, old_hash: str):
+    """Function for upgrading a stored password hash to the current hashing policy"""
+    try:
+        new_hash = await password_hasher.hash(password)
+
+        async with open_session() as db:
+            # only replace the hash that was verified, a concurrent password change wins
+            await db.execute(
+                update(UserModel)
+                .where(UserModel.uuid == user_uuid, UserModel.password == old_hash)
+                .values(password=new_hash)
+            )
+            await db.commit()
+    except PasswordHasherBusyException:
+        pass  # the hash is upgraded on a later sign-in
+    except SQLAlchemyError as err:
+        logger.warning("Could not rehash the password of %s: %s", user_uuid, err)
 
 
 class UserService:
     """User service class for handling user related JWT and database connections"""
 
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession, redis: Optional[Redis] = None):
         self.db = db
+        self.redis = redis
 
-    def create_user(self, user: UserCreate):
+    async def create_user(self, user: UserCreate):
         """Create user use case method"""
         try:
             db = self.db
 
             db_user = UserModel(
                 username=user.username,
-                password=pwd_context.hash(user.password),
+                password=await password_hasher.hash(user.password),
                 name=user.name,
             )
             db.add(db_user)
-            db.commit()
-            db.refresh(db_user)
+            await db.commit()
+            await db.refresh(db_user)
 
             user_result = User(
                 uuid=db_user.uuid,
@@ -45,32 +94,107 @@ class UserService:
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT, detail="User already exists"
             ) from err
+        except PasswordHasherBusyException as err:
+            raise hasher_busy_exception() from err
 
-    def signin(self, user_signin: UserSignIn):
+    async def signin(self, user_signin: UserSignIn):
         """User signin use case method"""
         db = self.db
 
         try:
-            db_user = (
-                db.query(UserModel)
-                .filter(UserModel.username == user_signin.username)
-                .one()
+            result = await db.execute(
+                select(UserModel).filter(UserModel.username == user_signin.username)
             )
+            db_user = result.scalar_one()
 
-            if not pwd_context.verify(user_signin.password, db_user.password):
+            if not await password_hasher.verify(user_signin.password, db_user.password):
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
                     detail="Invalid username or password",
                 )
+
+            if settings.password_rehash_on_login and password_hasher.needs_update(
+                db_user.password
+            ):
+                task = asyncio.create_task(
+                    rehash_user_password(
+                        str(db_user.uuid), user_signin.password, db_user.password
+                    )
+                )
+                rehash_tasks.add(task)
+                task.add_done_callback(rehash_tasks.discard)
+
             return str(db_user.uuid)
 
-        except NoResultFound as err:
+        except (NoResultFound, ValueError) as err:
+            # ValueError: the stored hash is malformed or of an unknown scheme
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid username or password",
             ) from err
+        except PasswordHasherBusyException as err:
+            raise hasher_busy_exception() from err
+
+    async def revoke_access_tokens(self, user_uuid: str):
+        """Revoke every access token issued to an user until now use case method"""
+        if self.redis is None:
+            return
+
+        # queued for replay by the block list service when Redis is unavailable
+        await BlockListService(self.redis).revoke_user_tokens(user_uuid)
+
+    async def import_users(self, users: List[UserImport]):
+        """Import a batch of users use case method, returning the usernames already taken"""
+        db = self.db
+        usernames = [user.username for user in users]
+
+        # existing users are left out before spending any time hashing their passwords
+        result = await db.execute(
+            select(UserModel.username).filter(UserModel.username.in_(usernames))
+        )
+        taken = set(result.scalars())
+        users = [user for user in users if user.username not in taken]
+        if not users:
+            return taken
+
+        hashes = iter(
+            await password_hasher.hash_many(
+                [user.password for user in users if user.password_hash is None]
+            )
+        )
+        now = datetime.utcnow()
+        rows = [
+            {
+                "uuid": generate_uuid(),
+                "username": user.username,
+                "password": user.password_hash or next(hashes),
+                "name": user.name,
+                "created_at": now,
+            }
+            for user in users
+        ]
+
+        dialect_name = db.bind.dialect.name
+        if dialect_name not in CONFLICT_IGNORING_DIALECTS:
+            await db.execute(insert(UserModel), rows)
+        else:
+            # imported here, the postgresql dialect module is slow to load
+            dialect = importlib.import_module(f"sqlalchemy.dialects.{dialect_name}")
+            # users registered meanwhile are skipped instead of failing the whole batch
+            result = await db.execute(
+                dialect.insert(UserModel)
+                .on_conflict_do_nothing(index_elements=[UserModel.username])
+                .returning(UserModel.username),
+                rows,
+            )
+            inserted = set(result.scalars())
+            taken.update(user.username for user in users if user.username not in inserted)
 
-    def refresh_user_token(self, refresh_token: str):
+        await db.commit()
+
+        return taken
+
+    async def refresh_user_token(self, refresh_token: str):
         """Refresh tokens use case method"""
         db = self.db
         usertoken_service = UserTokenService(db)
@@ -82,31 +206,35 @@ class UserService:
             )
 
         user_uuid = decode_user_uuid(refresh_token, settings.refresh_token_private_key)
+        tokens = create_user_tokens(user_uuid)
 
         try:
-            # look for a valid refresh token
-            usertoken = usertoken_service.find_usertoken(refresh_token)
-
-            # in case a (valid) refresh token arives here but it is not in the database
-            # (i.e., someone else used it), force the sign-in from all devices again
-            if usertoken is None:
-                print(
-                    f"The refresh token sent from {user_uuid} could be used in another " \
-                      "device. All devices were signed out."
-                )
-                usertoken_service.remove_all_user_tokens_by_uuid(user_uuid)
-
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Reusing rotated refresh token is not allowed. " \
-                    "Expiring all refresh tokens",
-                )
-
-            usertoken_service.remove_user_token_by_token(refresh_token)
-
-            return user_uuid
+            # swap the refresh token for the new one, in case a (valid) refresh token
+            # arives here but it is not in the database (i.e., someone else used it),
+            # force the sign-in from all devices again
+            rotated = await usertoken_service.rotate_user_token(
+                refresh_token,
+                UserTokenCreate(uuid=user_uuid, refresh_token=tokens["refresh_token"]),
+            )
         except SQLAlchemyError as err:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid token",
             ) from err
+
+        if not rotated:
+            REFRESH_TOKEN_REUSES.inc()
+            logger.warning(
+                "The refresh token sent from %s could be used in another device. "
+                "All devices were signed out.",
+                user_uuid,
+            )
+            await self.revoke_access_tokens(user_uuid)
+
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Reusing rotated refresh token is not allowed. " \
+                "Expiring all refresh tokens",
+            )
+
+        return tokens
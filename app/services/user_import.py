@@ -0,0 +1,146 @@
+"""Bulk import of users coming from another system
+
+Users are read as NDJSON, one object per line with username, name and either
+a plain password or an already computed password_hash. Lines are grouped in
+batches: the plain passwords of a batch are hashed in parallel by the
+password hasher workers and the users are stored with one multi-row INSERT.
+Rejected lines are reported without aborting the import. It is exposed by
+the admin router, or can be run from the command line:
+
+    python -m app.services.user_import users.ndjson
+"""
+import argparse
+import asyncio
+import sys
+import time
+from typing import AsyncIterable, AsyncIterator, List, Tuple
+import orjson
+from pydantic import ValidationError
+from app.db.connection import dispose_engine, open_session
+from app.schemas.user import UserImport, UserImportFailure, UserImportSummary
+from app.services.user import UserService
+from app.utils.password import password_hasher
+from app.utils.settings import settings
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """Split a stream of byte chunks into lines"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+
+    if buffer:
+        yield buffer
+
+
+def parse_user_line(line: bytes) -> UserImport:
+    """Parse and validate a single NDJSON line, raising ValueError when invalid"""
+    try:
+        user = UserImport.model_validate(orjson.loads(line))
+    except orjson.JSONDecodeError as err:
+        raise ValueError("Invalid JSON") from err
+    except ValidationError as err:
+        raise ValueError(
+            "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in err.errors())
+        ) from err
+
+    if (user.password is None) == (user.password_hash is None):
+        raise ValueError("Either password or password_hash is required")
+    if user.password_hash is not None and not password_hasher.is_hash(user.password_hash):
+        raise ValueError("Unsupported password hash")
+
+    return user
+
+
+async def import_batch(batch: List[Tuple[int, UserImport]], summary: UserImportSummary):
+    """Store a batch of users, adding the already taken usernames to the failures"""
+    async with open_session() as db:
+        taken = await UserService(db).import_users([user for _, user in batch])
+
+    for line_number, user in batch:
+        if user.username in taken:
+            summary.failures.append(
+                UserImportFailure(
+                    line=line_number, username=user.username, detail="User already exists"
+                )
+            )
+        else:
+            summary.imported += 1
+
+
+async def import_users_ndjson(lines: AsyncIterable[bytes], batch_size: int):
+    """Import every user of a NDJSON stream in batches"""
+    summary = UserImportSummary()
+    batch: List[Tuple[int, UserImport]] = []
+    batch_usernames = set()
+    line_number = 0
+
+    async for line in lines:
+        line_number += 1
+        if not line.strip():
+            continue
+
+        try:
+            user = parse_user_line(line)
+        except ValueError as err:
+            summary.failures.append(UserImportFailure(line=line_number, detail=str(err)))
+            continue
+
+        if user.username in batch_usernames:
+            summary.failures.append(
+                UserImportFailure(
+                    line=line_number, username=user.username, detail="User already exists"
+                )
+            )
+            continue
+
+        batch.append((line_number, user))
+        batch_usernames.add(user.username)
+
+        if len(batch) >= batch_size:
+            await import_batch(batch, summary)
+            batch, batch_usernames = [], set()
+
+    if batch:
+        await import_batch(batch, summary)
+
+    summary.failures.sort(key=lambda failure: failure.line)
+
+    return summary
+
+
+async def read_file_lines(path: str) -> AsyncIterator[bytes]:
+    """Read the lines of a file, or of the standard input when the path is '-'"""
+    with (sys.stdin.buffer if path == "-" else open(path, "rb")) as file:
+        for line in file:
+            yield line.rstrip(b"\r\n")
+
+
+async def import_file(path: str, batch_size: int):
+    """Import a NDJSON file and release the workers and connections afterwards"""
+    password_hasher.start()
+    try:
+        return await import_users_ndjson(read_file_lines(path), batch_size)
+    finally:
+        password_hasher.shutdown()
+        await dispose_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import users from a NDJSON file")
+    parser.add_argument("path", help="NDJSON file, or - to read the standard input")
+    parser.add_argument("--batch-size", type=int, default=settings.user_import_batch_size)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    result = asyncio.run(import_file(args.path, args.batch_size))
+
+    for failure in result.failures:
+        print(f"line {failure.line}: {failure.username or '-'}: {failure.detail}")
+    print(
+        f"Imported {result.imported} users, rejected {len(result.failures)} lines " \
+        f"in {time.perf_counter() - start:.3f}s"
+    )
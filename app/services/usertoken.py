@@ -1,69 +1,175 @@
 """Service for managing generated usertoken"""
-from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.models import UserModel, UserTokenModel
+from app.db.models import UserTokenModel
 from app.schemas.usertoken import UserToken, UserTokenCreate
+from app.utils.jwt import token_digest
+from app.utils.metrics import timed
+from app.utils.settings import settings
 
 
 class UserTokenService:
-    """UserToken service class for handling usertoken database connections"""
+    """UserToken service class for handling usertoken database connections
 
-    def __init__(self, db: Session):
+    Only a digest of each refresh token is persisted; lookups hash the
+    presented token and hit the unique token_hash index.
+    """
+
+    def __init__(self, db: AsyncSession):
         self.db = db
 
-    def insert_user_token(self, usertoken: UserTokenCreate):
-        """Create a new usertoken record to store the current valid refresh token"""
+    @timed("usertoken_insert_user_token")
+    async def insert_user_token(self, usertoken: UserTokenCreate):
+        """Create a new usertoken record to store the current valid refresh token
+
+        When the user goes over the maximum number of sessions, the oldest ones
+        are evicted in the same transaction. As the cap is enforced on every
+        insert, the eviction only removes the few rows past the limit. An evicted
+        refresh token can't be told apart from a rotated one, so presenting it
+        later is handled as a reuse.
+        """
         db = self.db
 
         db_usertoken = UserTokenModel(
             uuid=usertoken.uuid,
-            refresh_token=usertoken.refresh_token,
+            token_hash=token_digest(usertoken.refresh_token),
         )
 
         db.add(db_usertoken)
-        db.commit()
-        db.refresh(db_usertoken)
+
+        if settings.max_sessions_per_user > 0:
+            await db.flush()
+
+            evicted = (
+                select(UserTokenModel.token_hash)
+                .filter(UserTokenModel.uuid == usertoken.uuid)
+                .order_by(UserTokenModel.created_at.desc())
+                .offset(settings.max_sessions_per_user)
+            )
+            await db.execute(
+                delete(UserTokenModel).filter(UserTokenModel.token_hash.in_(evicted))
+            )
+
+        await db.commit()
+        await db.refresh(db_usertoken)
 
         usertoken = UserToken(
             uuid=db_usertoken.uuid,
-            refresh_token=db_usertoken.refresh_token,
+            refresh_token=usertoken.refresh_token,
             created_at=db_usertoken.created_at,
         )
 
         return usertoken
 
-    def find_usertoken(self, token: str):
+    @timed("usertoken_find_usertoken")
+    async def find_usertoken(self, token: str):
         """Return a UserToken object found by a refresh token"""
         db = self.db
 
-        db_usertoken = (
-            db.query(UserTokenModel)
-            .join(UserModel)
-            .filter(UserTokenModel.refresh_token == token)
-            .first()
+        result = await db.execute(
+            select(UserTokenModel).filter(
+                UserTokenModel.token_hash == token_digest(token)
+            )
         )
+        db_usertoken = result.scalars().first()
 
         if db_usertoken is None:
             return None
 
         usertoken = UserToken(
             uuid=db_usertoken.uuid,
-            refresh_token=db_usertoken.refresh_token,
+            refresh_token=token,
             created_at=db_usertoken.created_at,
         )
 
         return usertoken
 
-    def remove_all_user_tokens_by_uuid(self, uuid: str):
+    @timed("usertoken_find_user_sessions")
+    async def find_user_sessions(self, uuid: str):
+        """Return the token digests and creation dates of the non expired sessions of an user"""
+        db = self.db
+
+        created_after = datetime.utcnow() - timedelta(minutes=settings.refresh_token_expiration)
+        result = await db.execute(
+            select(UserTokenModel.token_hash, UserTokenModel.created_at)
+            .filter(
+                UserTokenModel.uuid == uuid,
+                UserTokenModel.created_at > created_after,
+            )
+            .order_by(UserTokenModel.created_at.desc())
+        )
+
+        return result.all()
+
+    @timed("usertoken_rotate_user_token")
+    async def rotate_user_token(self, token: str, usertoken: UserTokenCreate):
+        """Replace a refresh token by a new one in a single transaction
+
+        The old token is removed with a conditional DELETE ... RETURNING, so
+        only one of several concurrent rotations of the same token can match
+        it. When nothing matches, the token was already rotated (i.e., it is
+        being reused) and every refresh token of the user is revoked instead.
+        Returns whether the rotation took place.
+        """
+        db = self.db
+
+        result = await db.execute(
+            delete(UserTokenModel)
+            .filter_by(token_hash=token_digest(token))
+            .returning(UserTokenModel.uuid)
+        )
+
+        if result.first() is None:
+            await db.execute(delete(UserTokenModel).filter_by(uuid=usertoken.uuid))
+            await db.commit()
+            return False
+
+        db.add(
+            UserTokenModel(
+                uuid=usertoken.uuid,
+                token_hash=token_digest(usertoken.refresh_token),
+            )
+        )
+        await db.commit()
+
+        return True
+
+    @timed("usertoken_remove_all_user_tokens_by_uuid")
+    async def remove_all_user_tokens_by_uuid(self, uuid: str):
         """Remove all UserToken records by UUID"""
         db = self.db
 
-        db.query(UserTokenModel).filter_by(uuid=uuid).delete()
-        db.commit()
+        await db.execute(delete(UserTokenModel).filter_by(uuid=uuid))
+        await db.commit()
 
-    def remove_user_token_by_token(self, token: str):
+    @timed("usertoken_remove_user_token_by_token")
+    async def remove_user_token_by_token(self, token: str):
         """Remove the UserToken record by token"""
         db = self.db
 
-        db.query(UserTokenModel).filter_by(refresh_token=token).delete()
-        db.commit()
+        if token is None:
+            return
+
+        await db.execute(
+            delete(UserTokenModel).filter_by(token_hash=token_digest(token))
+        )
+        await db.commit()
+
+    @timed("usertoken_remove_expired_user_tokens")
+    async def remove_expired_user_tokens(self, created_before: datetime, limit: int):
+        """Remove up to limit UserToken records created before a date, returning how many"""
+        db = self.db
+
+        expired = (
+            select(UserTokenModel.token_hash)
+            .filter(UserTokenModel.created_at < created_before)
+            .limit(limit)
+        )
+        result = await db.execute(
+            delete(UserTokenModel).filter(UserTokenModel.token_hash.in_(expired))
+        )
+        await db.commit()
+
+        return result.rowcount
@@ -1,15 +1,27 @@
 """Utility functions for handling authentication"""
-from typing import Annotated
+import hmac
+from typing import Annotated, NamedTuple, Optional, Union
 from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
-from redis import Redis
+from fastapi.security import APIKeyHeader, OAuth2PasswordBearer
+from redis.asyncio import Redis
 from app.errors import TokenDecodingException, TokenExpiredException
 from app.services.blocklist import BlockListService
+from app.utils.keys import KeyRing
 from app.utils.settings import settings
-from app.utils.jwt import decode_token_payload
+from app.utils.jwt import decode_token_payload, get_access_token_secret
 from app.utils.redis import get_redis
+from app.utils.token_cache import verified_token_cache
+
+class TokenClaims(NamedTuple):
+    """Verified claims of a JWT token"""
+
+    sub: str
+    exp: Optional[int]
+    iat_ms: Optional[int]
+
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
+admin_key_scheme = APIKeyHeader(name="X-Admin-Key", auto_error=False)
 
 
 def get_access_token(token: Annotated[str, Depends(oauth2_scheme)] = None):
@@ -17,38 +29,68 @@ def get_access_token(token: Annotated[str, Depends(oauth2_scheme)] = None):
     return token
 
 
-def get_access_token_user_uuid(
+async def get_access_token_user_uuid(
     token: Annotated[str, Depends(oauth2_scheme)],
     redis: Annotated[Redis, Depends(get_redis)] = None,
 ):
     """Function for extracting Authorization header and return the associated user UUID key"""
+    claims = decode_user_claims(token, get_access_token_secret())
 
     if redis:
         blocklist_service = BlockListService(redis)
-        is_blocked = blocklist_service.is_token_blocked(token)
+        is_revoked = await blocklist_service.is_token_revoked(
+            token, claims.sub, access_token_issued_at(claims)
+        )
 
-        if is_blocked:
+        if is_revoked:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Reusing a signed-out token is not allowed",
             )
 
-    return decode_user_uuid(token, settings.access_token_private_key)
+    return claims.sub
+
 
+def access_token_issued_at(claims: TokenClaims) -> int:
+    """Function returning when an access token was issued in ms, derived from exp if needed"""
+    if claims.iat_ms is not None:
+        return claims.iat_ms
 
-def decode_user_uuid(token: str, secret: str):
+    if claims.exp is not None:
+        return (claims.exp - settings.access_token_expiration * 60) * 1000
+
+    return 0
+
+
+def decode_user_uuid(token: str, secret: Union[str, KeyRing]):
     """Function for decoding a JWT token, using an specific secret, and return its UUID key"""
+    return decode_user_claims(token, secret).sub
+
+
+def decode_user_claims(token: str, secret: Union[str, KeyRing]) -> TokenClaims:
+    """Function for decoding a JWT token, using an specific secret, and return its claims"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
     )
 
+    cached = verified_token_cache.get(token, secret)
+    if cached is not None:
+        return TokenClaims(cached.sub, int(cached.exp), cached.iat_ms)
+
     try:
         payload = decode_token_payload(token, secret)
         user_uuid = str(payload["sub"])
+        exp = payload.get("exp")
+        iat = payload.get("iat")
+        iat_ms = round(float(iat) * 1000) if iat is not None else None
 
-        return user_uuid
-    except KeyError as err:
+        if exp is not None:
+            exp = int(exp)
+            verified_token_cache.put(token, secret, user_uuid, exp, iat_ms)
+
+        return TokenClaims(user_uuid, exp, iat_ms)
+    except (KeyError, TypeError, ValueError) as err:
         raise credentials_exception from err
     except TokenDecodingException as err:
         raise credentials_exception from err
@@ -57,3 +99,14 @@ def decode_user_uuid(token: str, secret: str):
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Token expired",
         ) from err
+
+
+def verify_admin_key(admin_key: Annotated[Union[str, None], Depends(admin_key_scheme)]):
+    """Function for allowing the admin endpoints only to requests with the admin API key"""
+    if not settings.admin_api_key or not admin_key or not hmac.compare_digest(
+        admin_key, settings.admin_api_key
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not allowed",
+        )
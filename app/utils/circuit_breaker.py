@@ -0,0 +1,111 @@
+"""Circuit breaker failing fast while a dependency keeps failing
+
+After failure_threshold consecutive failures (errors or calls exceeding
+their timeout) the circuit opens and every call is refused at once, so the
+callers answer from their degraded path instead of waiting on the dependency.
+Once reset_timeout has passed a single call is let through (half-open):
+its success closes the circuit, its failure opens it again.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional, Tuple, Type, TypeVar
+from app.errors import ServiceUnavailableException
+from app.utils.metrics import CIRCUIT_BREAKER_STATE
+
+CLOSED = "closed"
+HALF_OPEN = "half-open"
+OPEN = "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Circuit breaker class guarding the calls to a dependency"""
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int,
+        reset_timeout: float,
+        errors: Tuple[Type[BaseException], ...] = (OSError,),
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.errors = errors + (asyncio.TimeoutError,)
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._state_gauge = CIRCUIT_BREAKER_STATE.labels(name)
+        self._state_gauge.set(STATE_VALUES[CLOSED])
+
+    @property
+    def is_open(self):
+        """Whether the calls are currently refused without trying the dependency"""
+        return self.state == OPEN and time.monotonic() - self._opened_at < self.reset_timeout
+
+    def _set_state(self, state: str):
+        """Switch to a state, reporting the transition"""
+        if state != self.state:
+            logger.log(
+                logging.WARNING if state == OPEN else logging.INFO,
+                "Circuit breaker %s is now %s (was %s)",
+                self.name,
+                state,
+                self.state,
+            )
+            self.state = state
+            self._state_gauge.set(STATE_VALUES[state])
+
+    def allow(self) -> bool:
+        """Return whether a call may be attempted, letting one probe through when half-open"""
+        if self.state == CLOSED:
+            return True
+
+        if self.state == OPEN and not self.is_open:
+            self._set_state(HALF_OPEN)
+
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+
+        return False
+
+    def record_success(self):
+        """Register a successful call, closing the circuit"""
+        self._failures = 0
+        self._probing = False
+        self._set_state(CLOSED)
+
+    def record_failure(self):
+        """Register a failed call, opening the circuit past the threshold or after a probe"""
+        self._failures += 1
+        self._probing = False
+
+        if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+    async def call(
+        self, func: Callable[..., Awaitable[T]], *args, timeout: Optional[float] = None
+    ) -> T:
+        """Await a coroutine function through the breaker, within an optional timeout"""
+        if not self.allow():
+            raise ServiceUnavailableException(f"{self.name} circuit is open")
+
+        try:
+            result = await asyncio.wait_for(func(*args), timeout)
+        except self.errors as err:
+            self.record_failure()
+            raise ServiceUnavailableException(f"{self.name} call failed: {err!r}") from err
+        except BaseException:
+            self._probing = False  # cancelled, neither a success nor a failure
+            raise
+
+        self.record_success()
+        return result
@@ -1,29 +1,163 @@
-"""Utility functions for handling JWT tokens"""
-from datetime import datetime, timedelta
-from jose import jwt, JWTError, ExpiredSignatureError
+"""Utility functions for handling JWT tokens
+
+HS256 tokens always have the same header and only carry the sub/exp claims,
+so they are encoded and decoded by a specialised codec: the header segment
+is pre-encoded, HMAC objects are pre-keyed once per secret and the signature
+is checked in constant time before any JSON parsing. The tokens are byte for
+byte identical to the ones python-jose produces, which is still used for the
+asymmetric algorithms and for any token that doesn't match the fast path.
+python-jose (and the cryptography backend it loads) is only imported by
+those paths, on first use.
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import time
+from datetime import timedelta
+from typing import Dict, Union
 from app.errors import TokenDecodingException, TokenExpiredException
+from app.utils.keys import SYMMETRIC_ALGORITHMS, KeyRing, key_ring
+from app.utils.metrics import timed
 from app.utils.settings import settings
 
 
-def create_jwt_token(uuid: str, secret: str, expires_delta: timedelta):
-    """Function for creating a new JWT token, based on a UUID, secret and expiration time"""
-    expire = datetime.utcnow() + expires_delta
+HS256_HEADER_SEGMENT = base64.urlsafe_b64encode(
+    json.dumps({"alg": "HS256", "typ": "JWT"}, separators=(",", ":"), sort_keys=True).encode()
+).rstrip(b"=")
+FAST_PATH_CLAIMS = frozenset(("sub", "exp", "iat"))
+
+_hmac_keys: Dict[str, "hmac.HMAC"] = {}
+
+
+def _get_hmac(secret: str):
+    """Return a fresh copy of the pre-keyed HMAC-SHA256 object of a secret"""
+    keyed = _hmac_keys.get(secret)
+    if keyed is None:
+        keyed = _hmac_keys[secret] = hmac.new(secret.encode("utf-8"), digestmod=hashlib.sha256)
+
+    return keyed.copy()
+
+
+def _b64encode(data: bytes):
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _b64decode(data: bytes):
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+
+def _encode_hs256(payload: dict, secret: str):
+    """Encode and sign a claim set with HS256, like jose.jwt.encode does"""
+    signing_input = HS256_HEADER_SEGMENT + b"." + _b64encode(
+        json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    )
+    signature = _get_hmac(secret)
+    signature.update(signing_input)
+
+    return (signing_input + b"." + _b64encode(signature.digest())).decode("utf-8")
+
+
+def _decode_hs256(token: str, secret: str):
+    """Verify and decode an HS256 token, falling back to python-jose when needed"""
+    try:
+        raw_token = token.encode("utf-8")
+        signing_input, signature_segment = raw_token.rsplit(b".", 1)
+        header_segment, payload_segment = signing_input.split(b".", 1)
+    except (AttributeError, UnicodeError, ValueError) as err:
+        raise TokenDecodingException from err
+
+    if header_segment != HS256_HEADER_SEGMENT:
+        return _decode_with_jose(token, secret)
+
+    expected = _get_hmac(secret)
+    expected.update(signing_input)
+
+    try:
+        signature = _b64decode(signature_segment)
+    except (binascii.Error, ValueError) as err:
+        raise TokenDecodingException from err
+
+    if not hmac.compare_digest(expected.digest(), signature):
+        raise TokenDecodingException
+
+    try:
+        payload = json.loads(_b64decode(payload_segment))
+    except (binascii.Error, ValueError) as err:
+        raise TokenDecodingException from err
+
+    if not isinstance(payload, dict) or not FAST_PATH_CLAIMS.issuperset(payload):
+        return _decode_with_jose(token, secret)
+
+    try:
+        exp = int(payload["exp"]) if "exp" in payload else None
+        if "iat" in payload:
+            int(payload["iat"])
+    except (TypeError, ValueError, OverflowError) as err:
+        raise TokenDecodingException from err
+
+    if "sub" in payload and not isinstance(payload["sub"], str):
+        raise TokenDecodingException
+
+    if exp is not None and exp < int(time.time()):
+        raise TokenExpiredException
+
+    return payload
+
+
+def _decode_with_jose(token: str, secret: str):
+    """Decode an HS256 token through the generic python-jose implementation"""
+    # pylint: disable=import-outside-toplevel
+    from jose import jwt, JWTError, ExpiredSignatureError
+
+    try:
+        return jwt.decode(token, secret, algorithms="HS256")
+    except ExpiredSignatureError as err:
+        raise TokenExpiredException from err
+    except JWTError as err:
+        raise TokenDecodingException from err
 
+
+def get_access_token_secret() -> Union[str, KeyRing]:
+    """Function returning the shared secret, or the key ring, used for access tokens"""
+    if settings.jwt_algorithm in SYMMETRIC_ALGORITHMS:
+        return settings.access_token_private_key
+
+    return key_ring
+
+
+@timed("jwt_encode")
+def create_jwt_token(uuid: str, secret: Union[str, KeyRing], expires_delta: timedelta):
+    """Function for creating a new JWT token, based on a UUID, secret and expiration time
+
+    The secret is either a shared HS256 secret or the key ring, in which case the
+    token is signed with the active private key and carries its kid.
+    """
+    issued_at_ms = int(time.time() * 1000)
+
+    # iat keeps the milliseconds (a NumericDate may be fractional), so revoking
+    # the tokens of an user doesn't also refuse the ones issued later that second
     payload = {
         "sub": uuid,
-        "exp": expire,
+        "exp": issued_at_ms // 1000 + int(expires_delta.total_seconds()),
+        "iat": issued_at_ms / 1000,
     }
 
-    encoded_jwt = jwt.encode(payload, secret, algorithm="HS256")
+    if isinstance(secret, KeyRing):
+        from jose import jwt  # pylint: disable=import-outside-toplevel
+
+        kid, key = secret.signing_key()
+        return jwt.encode(payload, key, algorithm=secret.algorithm, headers={"kid": kid})
+
+    encoded_jwt = _encode_hs256(payload, secret)
     return encoded_jwt
 
 
 def create_user_tokens(uuid: str):
     """Function for creating and returning the access and refresh tokens based on an user data"""
     access_token_expires = timedelta(minutes=settings.access_token_expiration)
-    access_token = create_jwt_token(
-        uuid, settings.access_token_private_key, access_token_expires
-    )
+    access_token = create_jwt_token(uuid, get_access_token_secret(), access_token_expires)
 
     refresh_token_expires = timedelta(minutes=settings.refresh_token_expiration)
     refresh_token = create_jwt_token(
@@ -33,12 +167,24 @@ def create_user_tokens(uuid: str):
     return {"access_token": access_token, "refresh_token": refresh_token}
 
 
-def decode_token_payload(token: str, secret: str):
+@timed("jwt_decode")
+def decode_token_payload(token: str, secret: Union[str, KeyRing]):
     """Function for decoding a JWT token, based on a secret key, and return its payload"""
+    if not isinstance(secret, KeyRing):
+        return _decode_hs256(token, secret)
+
+    # pylint: disable=import-outside-toplevel
+    from jose import jwt, JWTError, ExpiredSignatureError
+
     try:
-        payload = jwt.decode(token, secret, algorithms="HS256")
-        return payload
+        kid = jwt.get_unverified_header(token).get("kid")
+        return jwt.decode(token, secret.verification_key(kid), algorithms=secret.algorithm)
     except ExpiredSignatureError as err:
         raise TokenExpiredException from err
     except JWTError as err:
         raise TokenDecodingException from err
+
+
+def token_digest(token: str):
+    """Function for computing a fixed-size digest that identifies a token"""
+    return hashlib.sha256(token.encode()).hexdigest()
@@ -0,0 +1,157 @@
+"""Asymmetric signing keys for the access tokens
+
+When JWT_ALGORITHM is an asymmetric algorithm (RS256, ES256...), access
+tokens are signed with a private key and carry its "kid" header, so
+resource servers can verify them locally using the public keys published
+at /.well-known/jwks.json instead of calling back into this service.
+
+Keys are PEM files named "<kid>.pem" inside JWT_KEYS_DIR, parsed once and
+cached by kid. Every key in the directory is published and accepted for
+verification, but only JWT_ACTIVE_KID signs. Rotating without rejecting
+live tokens is done in overlapping steps:
+
+1. add the new key file and redeploy, it is published but not used yet;
+2. once the JWKS caches expired (JWKS_MAX_AGE), switch JWT_ACTIVE_KID;
+3. after one access token lifetime, remove the previous key (or keep only
+   its public part, "<kid>.pub.pem", until then).
+
+New keys can be generated with:
+
+    python -m app.utils.keys --kid 2026-10
+"""
+import argparse
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+from app.errors import SigningKeyException, TokenDecodingException
+from app.utils.settings import settings
+
+if TYPE_CHECKING:
+    from jose.backends.base import Key
+
+SYMMETRIC_ALGORITHMS = ("HS256", "HS384", "HS512")
+
+
+class KeyRing:
+    """Key ring class holding the signing and verification keys by kid
+
+    python-jose is only imported when the keys are loaded, so deployments
+    signing with HS256 never pay for it.
+    """
+
+    def __init__(self, keys_dir: str, algorithm: str, active_kid: str):
+        self.keys_dir = keys_dir
+        self.algorithm = algorithm
+        self.active_kid = active_kid
+        self._private_keys: Dict[str, "Key"] = {}
+        self._public_keys: Dict[str, "Key"] = {}
+        self._jwks: Optional[dict] = None
+
+    @property
+    def loaded(self):
+        """Whether the keys were already parsed"""
+        return self._jwks is not None
+
+    def load(self):
+        """Parse every key file of the keys directory"""
+        # pylint: disable=import-outside-toplevel
+        from jose import jwk
+        from jose.exceptions import JWKError
+
+        private_keys = {}
+        public_keys = {}
+
+        for path in sorted(Path(self.keys_dir).glob("*.pem")):
+            kid = path.name[: -len(".pub.pem")] if path.name.endswith(".pub.pem") else path.stem
+
+            try:
+                key = jwk.construct(path.read_text(encoding="utf-8"), self.algorithm)
+            except JWKError as err:
+                raise SigningKeyException(f"Invalid {self.algorithm} key {path}") from err
+
+            if key.is_public():
+                public_keys[kid] = key
+            else:
+                private_keys[kid] = key
+                public_keys[kid] = key.public_key()
+
+        if self.active_kid not in private_keys:
+            raise SigningKeyException(
+                f"No private key for the active kid '{self.active_kid}' in {self.keys_dir}"
+            )
+
+        self._private_keys = private_keys
+        self._public_keys = public_keys
+        self._jwks = {
+            "keys": [
+                {**key.to_dict(), "kid": kid, "use": "sig", "alg": self.algorithm}
+                for kid, key in public_keys.items()
+            ]
+        }
+
+        return self
+
+    def signing_key(self) -> Tuple[str, "Key"]:
+        """Return the active kid and its private key"""
+        if not self.loaded:
+            self.load()
+
+        return self.active_kid, self._private_keys[self.active_kid]
+
+    def verification_key(self, kid: Optional[str]) -> "Key":
+        """Return the public key of a kid, raising if it is unknown"""
+        if not self.loaded:
+            self.load()
+
+        key = self._public_keys.get(kid)
+        if key is None:
+            raise TokenDecodingException
+
+        return key
+
+    def jwks(self):
+        """Return the JSON Web Key Set with every public key"""
+        if not self.loaded:
+            self.load()
+
+        return self._jwks
+
+
+key_ring = KeyRing(settings.jwt_keys_dir, settings.jwt_algorithm, settings.jwt_active_kid)
+
+
+def generate_private_key_pem(algorithm: str) -> bytes:
+    """Function for generating a new PKCS#8 PEM private key for an algorithm"""
+    # pylint: disable=import-outside-toplevel
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+    if algorithm.startswith(("RS", "PS")):
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    elif algorithm in ("ES256", "ES384", "ES512"):
+        curve = {"ES256": ec.SECP256R1, "ES384": ec.SECP384R1, "ES512": ec.SECP521R1}
+        private_key = ec.generate_private_key(curve[algorithm]())
+    else:
+        raise SigningKeyException(f"Unsupported signing algorithm {algorithm}")
+
+    return private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a new token signing key")
+    parser.add_argument("--kid", required=True)
+    parser.add_argument(
+        "--algorithm",
+        default="RS256" if settings.jwt_algorithm in SYMMETRIC_ALGORITHMS else settings.jwt_algorithm,
+    )
+    parser.add_argument("--dir", default=settings.jwt_keys_dir)
+    args = parser.parse_args()
+
+    key_path = Path(args.dir) / f"{args.kid}.pem"
+    key_path.parent.mkdir(parents=True, exist_ok=True)
+    key_path.write_bytes(generate_private_key_pem(args.algorithm))
+    key_path.chmod(0o600)
+    print(f"Generated {args.algorithm} key {key_path}")
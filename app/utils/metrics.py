@@ -0,0 +1,177 @@
+"""Prometheus metrics of the API and of the authentication hot path
+
+Every request is timed by an ASGI middleware, labelled with the route
+template (never the raw path) so the number of series stays bounded. The
+internal stages (password hashing, JWT encoding/decoding, refresh token
+queries, block list calls and database pool checkouts) are observed in a
+single histogram labelled by stage. Label children are resolved once per
+stage, so recording is a perf_counter call and a histogram bucket update.
+
+When the server runs several worker processes, PROMETHEUS_MULTIPROC_DIR is
+set and every worker writes its values there, so any of them can expose
+the aggregated metrics.
+"""
+import functools
+import inspect
+import os
+import time
+from typing import Dict
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Latency of the HTTP requests",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "Number of HTTP requests being served",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+STAGE_LATENCY = Histogram(
+    "auth_stage_duration_seconds",
+    "Latency of the internal stages of the authentication requests",
+    ["stage"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+             0.25, 0.5, 1.0, 2.5),
+)
+REFRESH_TOKEN_REUSES = Counter(
+    "refresh_token_reuse_total",
+    "Number of rotated refresh tokens presented again",
+)
+LOGIN_THROTTLE_SKIPPED = Counter(
+    "login_throttle_skipped_total",
+    "Number of login throttle operations skipped while Redis was unavailable",
+    ["operation"],
+)
+CIRCUIT_BREAKER_STATE = Gauge(
+    "circuit_breaker_state",
+    "State of the circuit breakers: 0 closed, 1 half-open, 2 open",
+    ["name"],
+    multiprocess_mode="livemax",
+)
+PASSWORD_HASH_PENDING = Gauge(
+    "password_hash_pending",
+    "Number of password hashing jobs running or waiting for a worker",
+    multiprocess_mode="livesum",
+)
+PASSWORD_HASH_MAX_QUEUE = Gauge(
+    "password_hash_max_queue",
+    "Number of pending password hashing jobs accepted before refusing requests",
+    multiprocess_mode="livesum",
+)
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+def stage_histogram(stage: str):
+    """Function returning the histogram child that records a stage"""
+    return STAGE_LATENCY.labels(stage)
+
+
+def timed(stage: str):
+    """Decorator recording the duration of a function, sync or async, as a stage"""
+    histogram = stage_histogram(stage)
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - start)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def render_metrics():
+    """Function returning the metrics in the Prometheus text format and its content type"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int):
+    """Function dropping the live values (gauges) of a worker process that exited"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(pid)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording the latency and the in-flight count of the requests"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._route_paths: Dict[object, str] = {}
+
+    def _route_path(self, scope: Scope):
+        """Return the path template of the route that handled a request"""
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return UNMATCHED_ROUTE
+
+        path = self._route_paths.get(endpoint)
+        if path is None:
+            path = next(
+                (
+                    route.path
+                    for route in scope["app"].routes
+                    if getattr(route, "endpoint", None) is endpoint
+                ),
+                UNMATCHED_ROUTE,
+            )
+            self._route_paths[endpoint] = path
+
+        return path
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_progress.dec()
+            REQUEST_LATENCY.labels(method, self._route_path(scope), status_code).observe(
+                time.perf_counter() - start
+            )
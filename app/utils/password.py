@@ -0,0 +1,261 @@
+"""Utility functions for hashing and verifying passwords outside the event loop
+
+bcrypt costs hundreds of milliseconds of CPU per call, so running it inline
+would stall every other request served by the same worker. The hashing work
+is submitted to a dedicated executor with a bounded number of pending jobs,
+letting the endpoints fail fast instead of queueing without limit.
+
+The hashing cost is described by a HashingPolicy, which can be calibrated to
+a latency budget on the current host with the CLI below, once, its output
+being added to the configuration of every worker.
+Stored hashes produced with other parameters are reported by needs_update so
+they can be upgraded the next time their owner signs in.
+
+    python -m app.utils.password --scheme bcrypt --target-ms 250
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, NamedTuple, Optional, Tuple
+from app.errors import PasswordHasherBusyException
+from app.utils.metrics import PASSWORD_HASH_MAX_QUEUE, PASSWORD_HASH_PENDING, stage_histogram
+from app.utils.settings import settings
+
+if TYPE_CHECKING:
+    from passlib.context import CryptContext
+
+HASHING_SCHEMES = ("bcrypt", "argon2")
+BCRYPT_MAX_ROUNDS = 16
+ARGON2_MAX_ROUNDS = 32
+CALIBRATION_PASSWORD = "calibration-password"
+# the pool is started once the worker runs threads (event loop executor, aiosqlite,
+# Redis), and forking a multithreaded process can leave the children deadlocked
+# on the locks those threads held, so the hashing processes are never forked from it
+PROCESS_START_METHOD = (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+HASH_STAGE = stage_histogram("password_hash")
+VERIFY_STAGE = stage_histogram("password_verify")
+QUEUE_STAGE = stage_histogram("password_queue_wait")
+
+
+class HashingPolicy(NamedTuple):
+    """Password hashing scheme and its cost parameters
+
+    rounds is the bcrypt log2 cost or the argon2 time cost, 0 keeps the passlib
+    default. memory_cost (KiB) and parallelism only apply to argon2.
+    """
+
+    scheme: str
+    rounds: int = 0
+    memory_cost: int = 0
+    parallelism: int = 0
+
+
+@lru_cache(maxsize=8)
+def get_crypt_context(policy: HashingPolicy) -> "CryptContext":
+    """Function for building the passlib context hashing with a policy"""
+    # imported on first use, with its hashing backends
+    from passlib.context import CryptContext  # pylint: disable=import-outside-toplevel
+
+    options = {}
+    if policy.rounds:
+        # only the cheaper hashes are flagged by needs_update, a costlier one is kept
+        options[f"{policy.scheme}__default_rounds"] = policy.rounds
+        options[f"{policy.scheme}__min_rounds"] = policy.rounds
+    if policy.scheme == "argon2":
+        if policy.memory_cost:
+            options["argon2__memory_cost"] = policy.memory_cost
+        if policy.parallelism:
+            options["argon2__parallelism"] = policy.parallelism
+
+    # the other schemes are kept to verify (and then upgrade) older hashes
+    return CryptContext(
+        schemes=list(HASHING_SCHEMES),
+        default=policy.scheme,
+        deprecated="auto",
+        **options,
+    )
+
+
+def _timed_hash(password: str, policy: HashingPolicy) -> Tuple[str, float]:
+    """Function executed by the pool workers for hashing a password"""
+    start = time.perf_counter()
+    hashed = get_crypt_context(policy).hash(password)
+    return hashed, time.perf_counter() - start
+
+
+def _timed_verify(password: str, hashed: str, policy: HashingPolicy) -> Tuple[bool, float]:
+    """Function executed by the pool workers for verifying a password"""
+    start = time.perf_counter()
+    valid = get_crypt_context(policy).verify(password, hashed)
+    return valid, time.perf_counter() - start
+
+
+def calibrate_policy(policy: HashingPolicy, target_seconds: float) -> HashingPolicy:
+    """Function for finding the highest rounds whose hashing time fits the target latency"""
+    # bcrypt rounds are a power of two, so each step doubles the hashing time
+    rounds, max_rounds = (4, BCRYPT_MAX_ROUNDS) if policy.scheme == "bcrypt" else (1, ARGON2_MAX_ROUNDS)
+    calibrated = policy._replace(rounds=rounds)
+
+    # the first hash also loads the backend, it mustn't be timed
+    _timed_hash(CALIBRATION_PASSWORD, calibrated)
+
+    while rounds < max_rounds:
+        candidate = policy._replace(rounds=rounds + 1)
+        _, elapsed = _timed_hash(CALIBRATION_PASSWORD, candidate)
+        if elapsed > target_seconds:
+            break
+
+        calibrated = candidate
+        rounds += 1
+
+    return calibrated
+
+
+class PasswordHasher:
+    """Password hasher class running bcrypt in a bounded worker pool"""
+
+    def __init__(self, policy: HashingPolicy, executor_type: str, workers: int, max_queue: int):
+        self.policy = policy
+        self.executor_type = executor_type
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.pending = 0
+        self._executor: Optional[Executor] = None
+
+    def start(self):
+        """Create the worker pool used for hashing"""
+        if self._executor is None:
+            if self.executor_type == "thread":
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="bcrypt"
+                )
+            else:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(PROCESS_START_METHOD),
+                )
+            # set by each worker process, the multiprocess gauges sum them up
+            PASSWORD_HASH_MAX_QUEUE.set(self.max_queue)
+
+        return self._executor
+
+    def shutdown(self):
+        """Stop the worker pool, cancelling the jobs that didn't start yet"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _submit(self, stage, func, *args):
+        """Run a hashing function in the pool, rejecting it when the queue is full"""
+        if self.pending >= self.max_queue:
+            raise PasswordHasherBusyException
+
+        return await self._run(stage, func, *args)
+
+    async def _run(self, stage, func, *args):
+        """Run a hashing function in the pool, counting it as pending meanwhile"""
+        self.pending += 1
+        PASSWORD_HASH_PENDING.inc()
+        try:
+            loop = asyncio.get_running_loop()
+            start = time.perf_counter()
+            result, elapsed = await loop.run_in_executor(self.start(), func, *args)
+        finally:
+            self.pending -= 1
+            PASSWORD_HASH_PENDING.dec()
+
+        # the workers report the hashing time, the rest was spent waiting for one
+        stage.observe(elapsed)
+        QUEUE_STAGE.observe(max(time.perf_counter() - start - elapsed, 0.0))
+
+        return result
+
+    async def hash(self, password: str) -> str:
+        """Return the hash of a password using the current policy"""
+        return await self._submit(HASH_STAGE, _timed_hash, password, self.policy)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        """Check a password against a stored hash"""
+        return await self._submit(VERIFY_STAGE, _timed_verify, password, hashed, self.policy)
+
+    async def hash_many(self, passwords: List[str]) -> List[str]:
+        """Return the hashes of a batch of passwords, submitted in chunks of one job per worker
+
+        A chunk never takes the pending jobs past the queue bound (but holds
+        at least one job), so the requests queued meanwhile run after the
+        current chunk instead of waiting for the whole batch.
+        """
+        hashes: List[str] = []
+        while len(hashes) < len(passwords):
+            size = max(min(self.workers, self.max_queue - self.pending), 1)
+            chunk = passwords[len(hashes) : len(hashes) + size]
+            hashes.extend(
+                await asyncio.gather(
+                    *(
+                        self._run(HASH_STAGE, _timed_hash, password, self.policy)
+                        for password in chunk
+                    )
+                )
+            )
+
+        return hashes
+
+    def is_hash(self, value: str) -> bool:
+        """Check if a value is a well-formed hash of one of the supported schemes"""
+        context = get_crypt_context(self.policy)
+        scheme = context.identify(value, required=False)
+        if scheme is None:
+            return False
+
+        # identify only matches the prefix, parsing checks the parameters and checksum
+        try:
+            context.handler(scheme).from_string(value)
+        except ValueError:
+            return False
+
+        return True
+
+    def needs_update(self, hashed: str) -> bool:
+        """Check if a stored hash was produced with another scheme or cost"""
+        return get_crypt_context(self.policy).needs_update(hashed)
+
+
+password_hasher = PasswordHasher(
+    HashingPolicy(
+        settings.password_hash_scheme,
+        settings.password_hash_rounds,
+        settings.password_hash_memory_cost,
+        settings.password_hash_parallelism,
+    ),
+    settings.password_hash_executor,
+    settings.password_hash_workers,
+    settings.password_hash_max_queue,
+)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Calibrate the password hashing cost to a latency budget on this host"
+    )
+    parser.add_argument("--scheme", choices=HASHING_SCHEMES, default=settings.password_hash_scheme)
+    parser.add_argument("--target-ms", type=int, default=settings.password_hash_target_latency)
+    args = parser.parse_args()
+
+    result = calibrate_policy(
+        password_hasher.policy._replace(scheme=args.scheme), args.target_ms / 1000
+    )
+    _, seconds = _timed_hash(CALIBRATION_PASSWORD, result)
+
+    print(f"# {result.scheme} hashing takes {seconds * 1000:.0f} ms on this host")
+    print(f'PASSWORD_HASH_SCHEME="{result.scheme}"')
+    print(f"PASSWORD_HASH_ROUNDS={result.rounds}")
+    if result.scheme == "argon2":
+        print(f"PASSWORD_HASH_MEMORY_COST={result.memory_cost}")
+        print(f"PASSWORD_HASH_PARALLELISM={result.parallelism}")
@@ -0,0 +1,336 @@
+"""Opt-in request profiler writing the slow or sampled requests to disk
+
+A request is profiled when it carries a valid signed X-Profile header, when
+it is picked by the sampling rate, or (checked afterwards) when it took
+longer than the slow request threshold. Profiled requests are attributed
+the stack samples a background thread takes of the event loop thread every
+few milliseconds, the SQL statements they ran and their timings.
+
+Requests profiled on purpose (header or sampling) also get the await chain
+recorded while they are suspended, so the time spent waiting on the
+database or Redis shows up in the stacks. Requests only watched for the
+slow threshold skip that walk to keep the always-on cost low.
+
+Profiles are stored as JSON files in a bounded directory, oldest first out,
+with the stacks in the folded format understood by flamegraph.pl and
+speedscope. A signed header value can be generated with:
+
+    python -m app.utils.profiler
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.utils.settings import settings
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_ID_PATTERN = re.compile(r"^[0-9]{13}-[0-9a-f]{8}$")
+AWAIT_FRAME = "[await]"
+MAX_STATEMENT_LENGTH = 2000
+
+current_session: ContextVar[Optional["ProfileSession"]] = ContextVar(
+    "profile_session", default=None
+)
+
+
+def frame_label(frame) -> str:
+    """Function returning the flamegraph label of a stack frame"""
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def sign_profile_request(expires: int, secret: str) -> str:
+    """Function returning the X-Profile header value valid until a timestamp"""
+    signature = hmac.new(secret.encode(), str(expires).encode(), hashlib.sha256).hexdigest()
+    return f"{expires}:{signature}"
+
+
+def verify_profile_request(value: str, secret: str) -> bool:
+    """Function checking a X-Profile header value against the profiler secret"""
+    expires, _, _ = value.partition(":")
+    if not secret or not expires.isdigit() or int(expires) < time.time():
+        return False
+
+    return hmac.compare_digest(sign_profile_request(int(expires), secret), value)
+
+
+class ProfileSession:
+    """Samples, SQL statements and timings captured for a single request"""
+
+    def __init__(self, root_frame, task: Optional[asyncio.Task], follow_awaits: bool):
+        self.root_frame = root_frame
+        self.task = task
+        self.follow_awaits = follow_awaits
+        self.stacks: Counter = Counter()
+        self.sql: List[Dict] = []
+        self.started_at = datetime.utcnow()
+        self.start = time.perf_counter()
+
+    def elapsed(self) -> float:
+        """Return the seconds since the request started"""
+        return time.perf_counter() - self.start
+
+    def add_stack(self, frames: list, suspended: bool = False):
+        """Count a sample of the stack, given from the request root to the leaf"""
+        labels = [frame_label(frame) for frame in frames]
+        if suspended:
+            labels.append(AWAIT_FRAME)
+        self.stacks[";".join(labels)] += 1
+
+    def await_chain(self) -> list:
+        """Return the frames of the coroutines the suspended request is waiting on"""
+        frames = []
+        coro = self.task.get_coro() if self.task is not None else None
+        recording = False
+
+        while coro is not None:
+            frame = getattr(coro, "cr_frame", None)
+            if frame is None:
+                break
+            recording = recording or frame is self.root_frame
+            if recording:
+                frames.append(frame)
+            coro = getattr(coro, "cr_await", None)
+
+        return frames
+
+
+class StackSampler:
+    """Background thread sampling the event loop stack for the active sessions"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.thread_id: Optional[int] = None
+        self._sessions: Dict[object, ProfileSession] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self, thread_id: int):
+        """Start sampling the stack of a thread"""
+        if self._thread is None:
+            self.thread_id = thread_id
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="profiler-sampler", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """Stop the sampling thread"""
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+
+    def register(self, session: ProfileSession):
+        """Start attributing samples to a session"""
+        self._sessions[session.root_frame] = session
+
+    def unregister(self, session: ProfileSession):
+        """Stop attributing samples to a session"""
+        self._sessions.pop(session.root_frame, None)
+
+    def _run(self):
+        """Take a sample every interval until stopped"""
+        while not self._stopped.wait(self.interval):
+            if self._sessions:
+                self.sample()
+
+    def sample(self):
+        """Attribute the current stack to the running session and the await chains to the others"""
+        sessions = dict(self._sessions)
+        frame = sys._current_frames().get(self.thread_id)  # pylint: disable=protected-access
+        stack = []
+        running = None
+
+        while frame is not None:
+            stack.append(frame)
+            running = sessions.get(frame)
+            if running is not None:
+                running.add_stack(stack[::-1])
+                break
+            frame = frame.f_back
+
+        for session in sessions.values():
+            if session is not running and session.follow_awaits:
+                chain = session.await_chain()
+                if chain:
+                    session.add_stack(chain, suspended=True)
+
+
+class ProfileStore:
+    """Directory of profiles used as a ring buffer of at most max_files entries"""
+
+    def __init__(self, directory: str, max_files: int):
+        self.directory = Path(directory)
+        self.max_files = max_files
+
+    def _paths(self) -> List[Path]:
+        """Return the stored profile files, oldest first"""
+        if not self.directory.is_dir():
+            return []
+        return sorted(self.directory.glob("*.json"))
+
+    def save(self, record: dict):
+        """Store a profile and drop the oldest ones past the limit"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{record['id']}.json"
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(record))
+        tmp_path.replace(path)
+
+        paths = self._paths()
+        for old_path in paths[: max(len(paths) - self.max_files, 0)]:
+            old_path.unlink(missing_ok=True)
+
+    def list(self) -> List[dict]:
+        """Return the summary of every stored profile, newest first"""
+        summaries = []
+        for path in reversed(self._paths()):
+            try:
+                record = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue  # removed or being replaced meanwhile
+            summaries.append({key: record[key] for key in record if key not in ("stacks", "sql")})
+        return summaries
+
+    def load(self, profile_id: str) -> Optional[dict]:
+        """Return a stored profile, or None when it doesn't exist (anymore)"""
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        try:
+            return json.loads((self.directory / f"{profile_id}.json").read_text())
+        except (OSError, ValueError):
+            return None
+
+
+def _before_cursor_execute(conn, _cursor, _statement, _parameters, _context, _executemany):
+    """Engine hook remembering when a statement of a profiled request started"""
+    if current_session.get() is not None:
+        conn.info.setdefault("profiler_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, _cursor, statement, _parameters, _context, _executemany):
+    """Engine hook recording a statement of a profiled request, never its parameters"""
+    session = current_session.get()
+    if session is not None and conn.info.get("profiler_start"):
+        start = conn.info["profiler_start"].pop()
+        session.sql.append(
+            {
+                "statement": statement[:MAX_STATEMENT_LENGTH],
+                "offset": round(start - session.start, 6),
+                "duration": round(time.perf_counter() - start, 6),
+            }
+        )
+
+
+def instrument_engine(engine: Engine):
+    """Function attaching the SQL capture hooks to a (sync) engine"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+stack_sampler = StackSampler(settings.profiler_interval)
+profile_store = ProfileStore(settings.profiler_dir, settings.profiler_max_files)
+
+
+class ProfilerMiddleware:
+    """ASGI middleware profiling the signed, sampled and slow requests"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    @staticmethod
+    def _trigger(scope: Scope) -> Optional[str]:
+        """Return why a request must be profiled from the start, if it must"""
+        if settings.profiler_secret:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER:
+                    if verify_profile_request(value.decode("latin-1"), settings.profiler_secret):
+                        return "header"
+                    break
+
+        if settings.profiler_sample_rate > 0 and random.random() < settings.profiler_sample_rate:
+            return "sample"
+
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trigger = self._trigger(scope)
+        if trigger is None and settings.profiler_slow_threshold <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        stack_sampler.start(threading.get_ident())
+        session = ProfileSession(
+            sys._getframe(),  # pylint: disable=protected-access
+            asyncio.current_task(),
+            follow_awaits=trigger is not None,
+        )
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        token = current_session.set(session)
+        stack_sampler.register(session)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            stack_sampler.unregister(session)
+            current_session.reset(token)
+            duration = session.elapsed()
+
+            if trigger is None and duration * 1000 >= settings.profiler_slow_threshold:
+                trigger = "slow"
+
+            if trigger is not None:
+                record = {
+                    "id": f"{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}",
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status_code,
+                    "trigger": trigger,
+                    "started_at": session.started_at.isoformat(),
+                    "duration": round(duration, 6),
+                    "interval": stack_sampler.interval,
+                    "samples": sum(session.stacks.values()),
+                    "sql_duration": round(sum(query["duration"] for query in session.sql), 6),
+                    "stacks": [f"{stack} {count}" for stack, count in session.stacks.items()],
+                    "sql": session.sql,
+                }
+                # written off the event loop, a failure only loses this profile
+                asyncio.get_running_loop().run_in_executor(None, profile_store.save, record)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a signed X-Profile header value")
+    parser.add_argument("--ttl", type=int, default=3600, help="validity in seconds")
+    args = parser.parse_args()
+
+    if not settings.profiler_secret:
+        sys.exit("PROFILER_SECRET is not set")
+
+    print(f"X-Profile: {sign_profile_request(int(time.time()) + args.ttl, settings.profiler_secret)}")
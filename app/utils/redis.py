@@ -1,12 +1,54 @@
 """Module containing Redis utility function, such as the dependency injection function"""
-from redis import from_url
+from typing import Optional
+from redis.asyncio import BlockingConnectionPool, Redis
+from redis.exceptions import RedisError
+from app.utils.circuit_breaker import CircuitBreaker
 from app.utils.settings import settings
 
-def get_redis():
-    """Function for retrieving a Redis database connection"""
-    r = from_url(url=settings.redis_url, encoding="utf-8", decode_responses=True)
-    r.ping()
+redis_pool: Optional[BlockingConnectionPool] = None
+
+# guards the block list calls, so an unavailable Redis is detected once per
+# reset timeout instead of costing every request its socket timeout
+redis_breaker = CircuitBreaker(
+    "redis",
+    settings.redis_breaker_failure_threshold,
+    settings.redis_breaker_reset_timeout,
+    errors=(RedisError, OSError),
+)
+
+
+def init_redis_pool():
+    """Function for creating the process-wide Redis connection pool"""
+    global redis_pool  # pylint: disable=global-statement
+
+    if redis_pool is None:
+        redis_pool = BlockingConnectionPool.from_url(
+            url=settings.redis_url,
+            encoding="utf-8",
+            decode_responses=True,
+            max_connections=settings.redis_max_connections,
+            timeout=settings.redis_pool_timeout,
+            socket_timeout=settings.redis_socket_timeout,
+            socket_connect_timeout=settings.redis_socket_connect_timeout,
+            health_check_interval=settings.redis_health_check_interval,
+        )
+
+    return redis_pool
+
+
+async def close_redis_pool():
+    """Function for closing every connection held by the Redis connection pool"""
+    global redis_pool  # pylint: disable=global-statement
+
+    if redis_pool is not None:
+        await redis_pool.aclose()
+        redis_pool = None
+
+
+async def get_redis():
+    """Function for retrieving a Redis client leasing connections from the shared pool"""
+    r = Redis(connection_pool=init_redis_pool())
     try:
         yield r
     finally:
-        r.close()
+        await r.aclose()
@@ -0,0 +1,23 @@
+"""Utilities for serialising the API responses"""
+from typing import Any
+import orjson
+from fastapi import Response
+
+# the envelope of every successful response only changes in its data, so the bytes
+# around it are kept ready to be concatenated
+SUCCESS_PREFIX = b'{"status":true,"message":"Success","data":'
+SUCCESS_SUFFIX = b"}"
+
+
+def success_content(data: Any) -> bytes:
+    """Function for serialising a successful ResponseResult envelope around some data"""
+    return SUCCESS_PREFIX + orjson.dumps(data) + SUCCESS_SUFFIX
+
+
+def success_response(data: Any, status_code: int = 200) -> Response:
+    """Function for returning a pre-serialised successful response, skipping the response model"""
+    return Response(
+        content=success_content(data),
+        status_code=status_code,
+        media_type="application/json",
+    )
@@ -1,4 +1,6 @@
 """Application general settings"""
+from typing import Literal
+from pydantic import Field
 from pydantic_settings import BaseSettings
 from decouple import config
 
@@ -9,17 +11,205 @@ ACCESS_TOKEN_EXPIRATION = config("ACCESS_TOKEN_EXPIRATION", cast=int)
 REFRESH_TOKEN_EXPIRATION = config("REFRESH_TOKEN_EXPIRATION", cast=int)
 
 DB_URL = config("DB_URL")
+DB_ECHO = config("DB_ECHO", default=False, cast=bool)
+DB_POOL_SIZE = config("DB_POOL_SIZE", default=10, cast=int)
+DB_MAX_OVERFLOW = config("DB_MAX_OVERFLOW", default=20, cast=int)
+# in seconds
+DB_POOL_RECYCLE = config("DB_POOL_RECYCLE", default=1800, cast=int)
+DB_POOL_TIMEOUT = config("DB_POOL_TIMEOUT", default=5.0, cast=float)
+DB_STATEMENT_CACHE_SIZE = config("DB_STATEMENT_CACHE_SIZE", default=500, cast=int)
+SQLITE_JOURNAL_MODE = config("SQLITE_JOURNAL_MODE", default="WAL")
+SQLITE_SYNCHRONOUS = config("SQLITE_SYNCHRONOUS", default="NORMAL")
+# in milliseconds
+SQLITE_BUSY_TIMEOUT = config("SQLITE_BUSY_TIMEOUT", default=5000, cast=int)
+# in bytes
+SQLITE_MMAP_SIZE = config("SQLITE_MMAP_SIZE", default=268435456, cast=int)
 
 REDIS_URL = config("REDIS_URL")
+REDIS_MAX_CONNECTIONS = config("REDIS_MAX_CONNECTIONS", default=50, cast=int)
+REDIS_POOL_TIMEOUT = config("REDIS_POOL_TIMEOUT", default=1.0, cast=float)
+REDIS_SOCKET_TIMEOUT = config("REDIS_SOCKET_TIMEOUT", default=0.5, cast=float)
+REDIS_SOCKET_CONNECT_TIMEOUT = config("REDIS_SOCKET_CONNECT_TIMEOUT", default=1.0, cast=float)
+# in seconds
+REDIS_HEALTH_CHECK_INTERVAL = config("REDIS_HEALTH_CHECK_INTERVAL", default=30, cast=int)
+# "process" or "thread"
+PASSWORD_HASH_EXECUTOR = config("PASSWORD_HASH_EXECUTOR", default="process")
+# 0 means one worker per CPU core
+PASSWORD_HASH_WORKERS = config("PASSWORD_HASH_WORKERS", default=0, cast=int)
+PASSWORD_HASH_MAX_QUEUE = config("PASSWORD_HASH_MAX_QUEUE", default=64, cast=int)
+# in seconds
+PASSWORD_HASH_RETRY_AFTER = config("PASSWORD_HASH_RETRY_AFTER", default=1, cast=int)
+# "bcrypt" or "argon2", hashes using the other scheme are upgraded on sign-in
+PASSWORD_HASH_SCHEME = config("PASSWORD_HASH_SCHEME", default="bcrypt")
+# bcrypt log2 cost or argon2 time cost, 0 keeps the library default
+PASSWORD_HASH_ROUNDS = config("PASSWORD_HASH_ROUNDS", default=0, cast=int)
+# in KiB, argon2 only
+PASSWORD_HASH_MEMORY_COST = config("PASSWORD_HASH_MEMORY_COST", default=65536, cast=int)
+PASSWORD_HASH_PARALLELISM = config("PASSWORD_HASH_PARALLELISM", default=2, cast=int)
+# in milliseconds
+PASSWORD_HASH_TARGET_LATENCY = config("PASSWORD_HASH_TARGET_LATENCY", default=250, cast=int)
+PASSWORD_REHASH_ON_LOGIN = config("PASSWORD_REHASH_ON_LOGIN", default=True, cast=bool)
+JWT_CACHE_SIZE = config("JWT_CACHE_SIZE", default=10000, cast=int)
+# in seconds
+JWT_CACHE_TTL = config("JWT_CACHE_TTL", default=300, cast=int)
+BLOCKLIST_MIRROR = config("BLOCKLIST_MIRROR", default=False, cast=bool)
+BLOCKLIST_CHANNEL = config("BLOCKLIST_CHANNEL", default="blocklist")
+# in seconds
+BLOCKLIST_MIRROR_MAX_LAG = config("BLOCKLIST_MIRROR_MAX_LAG", default=5.0, cast=float)
+BLOCKLIST_LEGACY_KEYS = config("BLOCKLIST_LEGACY_KEYS", default=True, cast=bool)
+TOKEN_SWEEPER_ENABLED = config("TOKEN_SWEEPER_ENABLED", default=False, cast=bool)
+# in seconds
+TOKEN_SWEEPER_INTERVAL = config("TOKEN_SWEEPER_INTERVAL", default=3600, cast=float)
+TOKEN_SWEEPER_BATCH_SIZE = config("TOKEN_SWEEPER_BATCH_SIZE", default=500, cast=int)
+# in seconds
+TOKEN_SWEEPER_BATCH_PAUSE = config("TOKEN_SWEEPER_BATCH_PAUSE", default=0.1, cast=float)
+# HS256 signs the access tokens with ACCESS_TOKEN_PRIVATE_KEY, asymmetric
+# algorithms (RS256, ES256...) use the PEM keys stored in JWT_KEYS_DIR
+JWT_ALGORITHM = config("JWT_ALGORITHM", default="HS256")
+JWT_KEYS_DIR = config("JWT_KEYS_DIR", default="keys")
+JWT_ACTIVE_KID = config("JWT_ACTIVE_KID", default="")
+# in seconds
+JWKS_MAX_AGE = config("JWKS_MAX_AGE", default=3600, cast=int)
+INTROSPECT_MAX_TOKENS = config("INTROSPECT_MAX_TOKENS", default=500, cast=int)
+LOGIN_THROTTLE_ENABLED = config("LOGIN_THROTTLE_ENABLED", default=True, cast=bool)
+LOGIN_THROTTLE_USERNAME_LIMIT = config("LOGIN_THROTTLE_USERNAME_LIMIT", default=10, cast=int)
+# in seconds
+LOGIN_THROTTLE_USERNAME_WINDOW = config("LOGIN_THROTTLE_USERNAME_WINDOW", default=300, cast=int)
+# in seconds
+LOGIN_THROTTLE_USERNAME_BAN = config("LOGIN_THROTTLE_USERNAME_BAN", default=900, cast=int)
+LOGIN_THROTTLE_IP_LIMIT = config("LOGIN_THROTTLE_IP_LIMIT", default=100, cast=int)
+# in seconds
+LOGIN_THROTTLE_IP_WINDOW = config("LOGIN_THROTTLE_IP_WINDOW", default=60, cast=int)
+# in seconds
+LOGIN_THROTTLE_IP_BAN = config("LOGIN_THROTTLE_IP_BAN", default=300, cast=int)
+USER_IMPORT_BATCH_SIZE = config("USER_IMPORT_BATCH_SIZE", default=1000, cast=int)
+# the admin endpoints are disabled while no key is set
+ADMIN_API_KEY = config("ADMIN_API_KEY", default="")
+# oldest sessions are evicted past this number of refresh tokens, 0 disables the cap
+MAX_SESSIONS_PER_USER = config("MAX_SESSIONS_PER_USER", default=10, cast=int)
+# in seconds, how long a worker trusts the revoke-all watermarks read from Redis
+TOKEN_WATERMARK_CACHE_TTL = config("TOKEN_WATERMARK_CACHE_TTL", default=5.0, cast=float)
+METRICS_ENABLED = config("METRICS_ENABLED", default=True, cast=bool)
+# level of the application logs: DEBUG, INFO, WARNING or ERROR
+LOG_LEVEL = config("LOG_LEVEL", default="INFO")
+PROFILER_ENABLED = config("PROFILER_ENABLED", default=False, cast=bool)
+# fraction of the requests profiled, between 0 and 1
+PROFILER_SAMPLE_RATE = config("PROFILER_SAMPLE_RATE", default=0.0, cast=float)
+# in milliseconds, requests taking longer are stored, 0 disables it
+PROFILER_SLOW_THRESHOLD = config("PROFILER_SLOW_THRESHOLD", default=0, cast=int)
+# key signing the X-Profile request header, the header is ignored while unset
+PROFILER_SECRET = config("PROFILER_SECRET", default="")
+# in seconds
+PROFILER_INTERVAL = config("PROFILER_INTERVAL", default=0.005, cast=float)
+PROFILER_DIR = config("PROFILER_DIR", default="profiles")
+PROFILER_MAX_FILES = config("PROFILER_MAX_FILES", default=200, cast=int)
+SERVER_HOST = config("SERVER_HOST", default="0.0.0.0")
+SERVER_PORT = config("SERVER_PORT", default=8000, cast=int)
+# 0 starts one worker per available core
+SERVER_WORKERS = config("SERVER_WORKERS", default=0, cast=int)
+# in seconds, how long in-flight requests are given to finish on restart/shutdown
+SERVER_GRACEFUL_TIMEOUT = config("SERVER_GRACEFUL_TIMEOUT", default=30, cast=int)
+# in seconds
+SERVER_KEEPALIVE = config("SERVER_KEEPALIVE", default=5, cast=int)
+# comma separated proxy addresses whose X-Forwarded-For header is trusted, or "*"
+FORWARDED_ALLOW_IPS = config("FORWARDED_ALLOW_IPS", default="127.0.0.1")
+WARMUP_ENABLED = config("WARMUP_ENABLED", default=True, cast=bool)
+# consecutive failed Redis calls opening the circuit breaker
+REDIS_BREAKER_FAILURE_THRESHOLD = config("REDIS_BREAKER_FAILURE_THRESHOLD", default=5, cast=int)
+# in seconds, how long the circuit stays open before a call is tried again
+REDIS_BREAKER_RESET_TIMEOUT = config("REDIS_BREAKER_RESET_TIMEOUT", default=5.0, cast=float)
+# in milliseconds, latency budget of a block list check before it is answered locally
+BLOCKLIST_CHECK_TIMEOUT = config("BLOCKLIST_CHECK_TIMEOUT", default=100, cast=int)
+# "open" accepts the tokens unknown to the local cache while Redis is unavailable,
+# "closed" refuses the requests with a 503 instead
+BLOCKLIST_FAILURE_POLICY = config("BLOCKLIST_FAILURE_POLICY", default="open")
+BLOCKLIST_RECENT_CACHE_SIZE = config("BLOCKLIST_RECENT_CACHE_SIZE", default=10000, cast=int)
+BLOCKLIST_WRITE_QUEUE_SIZE = config("BLOCKLIST_WRITE_QUEUE_SIZE", default=10000, cast=int)
 
 class Settings(BaseSettings):
     """Class that groups all loaded application settings"""
     db_url: str = DB_URL
+    db_echo: bool = DB_ECHO
+    db_pool_size: int = DB_POOL_SIZE
+    db_max_overflow: int = DB_MAX_OVERFLOW
+    db_pool_recycle: int = DB_POOL_RECYCLE
+    db_pool_timeout: float = DB_POOL_TIMEOUT
+    db_statement_cache_size: int = DB_STATEMENT_CACHE_SIZE
+    sqlite_journal_mode: str = SQLITE_JOURNAL_MODE
+    sqlite_synchronous: str = SQLITE_SYNCHRONOUS
+    sqlite_busy_timeout: int = SQLITE_BUSY_TIMEOUT
+    sqlite_mmap_size: int = SQLITE_MMAP_SIZE
     access_token_private_key: str = ACCESS_TOKEN_PRIVATE_KEY
     refresh_token_private_key: str = REFRESH_TOKEN_PRIVATE_KEY
     access_token_expiration: int = ACCESS_TOKEN_EXPIRATION
     refresh_token_expiration: int = REFRESH_TOKEN_EXPIRATION
     redis_url: str = REDIS_URL
+    redis_max_connections: int = REDIS_MAX_CONNECTIONS
+    redis_pool_timeout: float = REDIS_POOL_TIMEOUT
+    redis_socket_timeout: float = REDIS_SOCKET_TIMEOUT
+    redis_socket_connect_timeout: float = REDIS_SOCKET_CONNECT_TIMEOUT
+    redis_health_check_interval: int = REDIS_HEALTH_CHECK_INTERVAL
+    password_hash_executor: str = PASSWORD_HASH_EXECUTOR
+    password_hash_workers: int = PASSWORD_HASH_WORKERS
+    password_hash_max_queue: int = PASSWORD_HASH_MAX_QUEUE
+    password_hash_retry_after: int = PASSWORD_HASH_RETRY_AFTER
+    password_hash_scheme: str = PASSWORD_HASH_SCHEME
+    password_hash_rounds: int = PASSWORD_HASH_ROUNDS
+    password_hash_memory_cost: int = PASSWORD_HASH_MEMORY_COST
+    password_hash_parallelism: int = PASSWORD_HASH_PARALLELISM
+    password_hash_target_latency: int = PASSWORD_HASH_TARGET_LATENCY
+    password_rehash_on_login: bool = PASSWORD_REHASH_ON_LOGIN
+    jwt_cache_size: int = JWT_CACHE_SIZE
+    jwt_cache_ttl: int = JWT_CACHE_TTL
+    blocklist_mirror: bool = BLOCKLIST_MIRROR
+    blocklist_channel: str = BLOCKLIST_CHANNEL
+    blocklist_mirror_max_lag: float = BLOCKLIST_MIRROR_MAX_LAG
+    blocklist_legacy_keys: bool = BLOCKLIST_LEGACY_KEYS
+    token_sweeper_enabled: bool = TOKEN_SWEEPER_ENABLED
+    token_sweeper_interval: float = TOKEN_SWEEPER_INTERVAL
+    token_sweeper_batch_size: int = TOKEN_SWEEPER_BATCH_SIZE
+    token_sweeper_batch_pause: float = TOKEN_SWEEPER_BATCH_PAUSE
+    jwt_algorithm: str = JWT_ALGORITHM
+    jwt_keys_dir: str = JWT_KEYS_DIR
+    jwt_active_kid: str = JWT_ACTIVE_KID
+    jwks_max_age: int = JWKS_MAX_AGE
+    introspect_max_tokens: int = INTROSPECT_MAX_TOKENS
+    login_throttle_enabled: bool = LOGIN_THROTTLE_ENABLED
+    login_throttle_username_limit: int = LOGIN_THROTTLE_USERNAME_LIMIT
+    login_throttle_username_window: int = LOGIN_THROTTLE_USERNAME_WINDOW
+    login_throttle_username_ban: int = LOGIN_THROTTLE_USERNAME_BAN
+    login_throttle_ip_limit: int = LOGIN_THROTTLE_IP_LIMIT
+    login_throttle_ip_window: int = LOGIN_THROTTLE_IP_WINDOW
+    login_throttle_ip_ban: int = LOGIN_THROTTLE_IP_BAN
+    user_import_batch_size: int = USER_IMPORT_BATCH_SIZE
+    admin_api_key: str = ADMIN_API_KEY
+    max_sessions_per_user: int = MAX_SESSIONS_PER_USER
+    token_watermark_cache_ttl: float = TOKEN_WATERMARK_CACHE_TTL
+    metrics_enabled: bool = METRICS_ENABLED
+    log_level: str = LOG_LEVEL
+    profiler_enabled: bool = PROFILER_ENABLED
+    profiler_sample_rate: float = PROFILER_SAMPLE_RATE
+    profiler_slow_threshold: int = PROFILER_SLOW_THRESHOLD
+    profiler_secret: str = PROFILER_SECRET
+    profiler_interval: float = PROFILER_INTERVAL
+    profiler_dir: str = PROFILER_DIR
+    profiler_max_files: int = PROFILER_MAX_FILES
+    server_host: str = SERVER_HOST
+    server_port: int = SERVER_PORT
+    server_workers: int = SERVER_WORKERS
+    server_graceful_timeout: int = SERVER_GRACEFUL_TIMEOUT
+    server_keepalive: int = SERVER_KEEPALIVE
+    forwarded_allow_ips: str = FORWARDED_ALLOW_IPS
+    warmup_enabled: bool = WARMUP_ENABLED
+    redis_breaker_failure_threshold: int = REDIS_BREAKER_FAILURE_THRESHOLD
+    redis_breaker_reset_timeout: float = REDIS_BREAKER_RESET_TIMEOUT
+    blocklist_check_timeout: int = BLOCKLIST_CHECK_TIMEOUT
+    # validated even when it comes from .env, any other value stops the startup
+    blocklist_failure_policy: Literal["open", "closed"] = Field(
+        BLOCKLIST_FAILURE_POLICY, validate_default=True
+    )
+    blocklist_recent_cache_size: int = BLOCKLIST_RECENT_CACHE_SIZE
+    blocklist_write_queue_size: int = BLOCKLIST_WRITE_QUEUE_SIZE
 
 
 settings = Settings()
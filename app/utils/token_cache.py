@@ -0,0 +1,71 @@
+"""In-process LRU cache of already verified JWT tokens
+
+A hot access token is presented many times during its lifetime, and each
+validation would otherwise redo the base64/JSON parsing, the HMAC check and
+the claim validation. Entries are keyed by a digest of the token, never
+outlive the token's own exp and are dropped when the token is blocklisted.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, NamedTuple, Optional
+from app.utils.jwt import token_digest
+from app.utils.settings import settings
+
+
+class CachedToken(NamedTuple):
+    """Verified claims stored for a cached token"""
+
+    secret: Any
+    sub: str
+    exp: float
+    iat_ms: Optional[int]
+    expires_at: float
+
+
+class VerifiedTokenCache:
+    """Bounded LRU cache with per-entry expiration"""
+
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, CachedToken]" = OrderedDict()
+
+    def get(self, token: str, secret: Any) -> Optional[CachedToken]:
+        """Return the cached claims of a token verified with the same secret"""
+        key = token_digest(token)
+        entry = self._entries.get(key)
+
+        if entry is None or entry.secret != secret:
+            return None
+
+        if entry.expires_at <= time.time():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, token: str, secret: Any, sub: str, exp: float, iat_ms: Optional[int] = None):
+        """Store the claims of a token that has just been verified"""
+        if self.max_size <= 0:
+            return
+
+        key = token_digest(token)
+        self._entries[key] = CachedToken(
+            secret, sub, exp, iat_ms, min(time.time() + self.ttl, exp)
+        )
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, token: str):
+        """Drop a token from the cache, e.g. after it was blocklisted"""
+        self._entries.pop(token_digest(token), None)
+
+    def clear(self):
+        """Drop every cached token"""
+        self._entries.clear()
+
+
+verified_token_cache = VerifiedTokenCache(settings.jwt_cache_size, settings.jwt_cache_ttl)
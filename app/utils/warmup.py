@@ -0,0 +1,74 @@
+"""Warm-up of a worker before it starts accepting requests
+
+The first requests served by a fresh worker would otherwise pay for opening
+the database and Redis connections, building the JWT key objects and
+starting the password hashing processes.
+"""
+import asyncio
+import logging
+import time
+from redis.asyncio import ConnectionPool, Redis
+from redis.exceptions import RedisError
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.pool import QueuePool
+from app.db.connection import init_engine
+from app.utils.jwt import create_user_tokens, decode_token_payload, get_access_token_secret
+from app.utils.password import password_hasher
+from app.utils.settings import settings
+
+logger = logging.getLogger(__name__)
+
+WARMUP_SUBJECT = "warm-up"
+WARMUP_PASSWORD = "warm-up-password"
+
+
+async def warm_up_database():
+    """Open the pooled database connections"""
+    engine = init_engine()
+
+    async def check_connection():
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    # holding the connections at the same time makes the pool open each of them
+    connections = settings.db_pool_size if isinstance(engine.pool, QueuePool) else 1
+    await asyncio.gather(*(check_connection() for _ in range(connections)))
+
+
+async def warm_up_redis(pool: ConnectionPool):
+    """Open a Redis connection"""
+    redis = Redis(connection_pool=pool)
+    try:
+        await redis.ping()
+    finally:
+        await redis.aclose()
+
+
+def warm_up_jwt():
+    """Build the signing and verification key objects by issuing and decoding tokens"""
+    tokens = create_user_tokens(WARMUP_SUBJECT)
+    decode_token_payload(tokens["access_token"], get_access_token_secret())
+    decode_token_payload(tokens["refresh_token"], settings.refresh_token_private_key)
+
+
+async def warm_up(redis_pool: ConnectionPool):
+    """Warm up every shared resource of the worker, reporting (not raising) the failures"""
+    start = time.perf_counter()
+
+    try:
+        await warm_up_database()
+    except (SQLAlchemyError, OSError) as err:
+        logger.warning("Database warm-up failed: %s", err)
+
+    try:
+        await warm_up_redis(redis_pool)
+    except (RedisError, OSError) as err:
+        logger.warning("Redis warm-up failed: %s", err)
+
+    warm_up_jwt()
+
+    # one job per hashing worker, so every process is started
+    await password_hasher.hash_many([WARMUP_PASSWORD] * password_hasher.workers)
+
+    logger.info("Worker warmed up in %.3fs", time.perf_counter() - start)
@@ -0,0 +1,26 @@
+"""Microbenchmarks for the authentication primitives and services
+
+The suite runs offline: the database is an in-memory SQLite and Redis is
+replaced by fakeredis, so the defaults below are applied before any
+application module reads its settings.
+
+    python -m benchmarks --save baseline.json
+    python -m benchmarks --compare baseline.json
+
+The import time of the application has its own budget check:
+
+    python -m benchmarks.startup
+"""
+import os
+
+BENCHMARK_ENVIRONMENT = {
+    "DB_URL": "sqlite+aiosqlite:///:memory:",
+    "ACCESS_TOKEN_PRIVATE_KEY": "benchmark-access-token",
+    "REFRESH_TOKEN_PRIVATE_KEY": "benchmark-refresh-token",
+    "ACCESS_TOKEN_EXPIRATION": "10",
+    "REFRESH_TOKEN_EXPIRATION": "10080",
+    "REDIS_URL": "redis://localhost:6379",
+}
+
+for name, value in BENCHMARK_ENVIRONMENT.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,67 @@
+"""Command line entry point for the benchmark suite"""
+import argparse
+import asyncio
+import sys
+import benchmarks  # noqa: F401 pylint: disable=unused-import
+from benchmarks.bench_auth import (
+    run_blocklist_benchmarks,
+    run_jwt_benchmarks,
+    run_password_benchmarks,
+)
+from benchmarks.bench_usertoken import run_usertoken_benchmarks
+from benchmarks.harness import compare_baseline, print_results, save_baseline
+from app.db.connection import dispose_engine
+
+
+async def run_async_benchmarks(args):
+    """Run the benchmarks that need an event loop"""
+    results = await run_blocklist_benchmarks(args.iterations)
+
+    try:
+        for size in args.sizes:
+            results += await run_usertoken_benchmarks(size, args.db_iterations)
+    finally:
+        await dispose_engine()
+
+    return results
+
+
+def main():
+    """Run the selected benchmarks, then report and compare them"""
+    parser = argparse.ArgumentParser(description="Authentication hot path benchmarks")
+    parser.add_argument("--iterations", type=int, default=10000)
+    parser.add_argument("--hash-iterations", type=int, default=10)
+    parser.add_argument("--db-iterations", type=int, default=500)
+    parser.add_argument(
+        "--sizes",
+        type=lambda value: [int(size) for size in value.split(",")],
+        default=[1000, 10000, 100000, 1000000],
+        help="comma separated user_token table sizes",
+    )
+    parser.add_argument("--save", metavar="PATH", help="store the results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a baseline")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="throughput loss ratio reported as a regression",
+    )
+    args = parser.parse_args()
+
+    results = run_jwt_benchmarks(args.iterations)
+    results += run_password_benchmarks(args.hash_iterations)
+    results += asyncio.run(run_async_benchmarks(args))
+
+    print_results(results)
+
+    if args.save:
+        save_baseline(args.save, results)
+
+    if args.compare:
+        print()
+        if compare_baseline(args.compare, results, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
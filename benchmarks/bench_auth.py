@@ -0,0 +1,94 @@
+"""Benchmarks for the JWT, password hashing and block list primitives"""
+from datetime import timedelta
+from fakeredis import FakeAsyncRedis
+from app.services.blocklist import BlockListService
+from app.utils.auth import decode_user_uuid
+from app.utils.jwt import create_jwt_token, create_user_tokens, decode_token_payload
+from app.utils.password import get_crypt_context, password_hasher
+from app.utils.settings import settings
+from app.utils.token_cache import verified_token_cache
+from benchmarks.harness import bench, bench_async
+
+USER_UUID = "0b6f3c1e-7d0a-4c55-9a3e-2f1d8e6b9c40"
+
+
+def run_jwt_benchmarks(iterations: int):
+    """Benchmark token creation and decoding"""
+    secret = settings.access_token_private_key
+    expires_delta = timedelta(minutes=settings.access_token_expiration)
+    token = create_jwt_token(USER_UUID, secret, expires_delta)
+
+    results = [
+        bench(
+            "create_jwt_token",
+            lambda i: create_jwt_token(USER_UUID, secret, expires_delta),
+            iterations,
+        ),
+        bench("create_user_tokens", lambda i: create_user_tokens(USER_UUID), iterations),
+        bench("decode_token_payload", lambda i: decode_token_payload(token, secret), iterations),
+    ]
+
+    cache_size = verified_token_cache.max_size
+    verified_token_cache.clear()
+    verified_token_cache.max_size = 0
+    results.append(
+        bench("decode_user_uuid[uncached]", lambda i: decode_user_uuid(token, secret), iterations)
+    )
+
+    verified_token_cache.max_size = cache_size
+    results.append(
+        bench("decode_user_uuid[cached]", lambda i: decode_user_uuid(token, secret), iterations)
+    )
+    verified_token_cache.clear()
+
+    return results
+
+
+def run_password_benchmarks(iterations: int):
+    """Benchmark password hashing and verification at the configured policy"""
+    pwd_context = get_crypt_context(password_hasher.policy)
+    hashed = pwd_context.hash("benchmark-password")
+
+    return [
+        bench("pwd_context.hash", lambda i: pwd_context.hash("benchmark-password"), iterations),
+        bench(
+            "pwd_context.verify",
+            lambda i: pwd_context.verify("benchmark-password", hashed),
+            iterations,
+        ),
+    ]
+
+
+async def run_blocklist_benchmarks(iterations: int):
+    """Benchmark block list lookups against an in-process fake Redis"""
+    redis = FakeAsyncRedis(decode_responses=True)
+    blocklist_service = BlockListService(redis)
+    secret = settings.access_token_private_key
+    blocked = [
+        create_jwt_token(f"blocked-{i}", secret, timedelta(minutes=10)) for i in range(100)
+    ]
+    allowed = create_jwt_token(USER_UUID, secret, timedelta(minutes=10))
+    payload = decode_token_payload(allowed, secret)
+    exp = int(payload["exp"])
+    issued_at = round(payload["iat"] * 1000)
+
+    for token in blocked:
+        await blocklist_service.add_token_to_blocklist(token, exp)
+
+    results = [
+        await bench_async(
+            "is_token_revoked[miss]",
+            lambda i: blocklist_service.is_token_revoked(allowed, USER_UUID, issued_at),
+            iterations,
+        ),
+        await bench_async(
+            "is_token_revoked[hit]",
+            lambda i: blocklist_service.is_token_revoked(
+                blocked[i % len(blocked)], f"blocked-{i % len(blocked)}", issued_at
+            ),
+            iterations,
+        ),
+    ]
+    await redis.aclose()
+
+    return results
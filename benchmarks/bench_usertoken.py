@@ -0,0 +1,116 @@
+"""Benchmarks for the UserTokenService queries at several table sizes"""
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import delete, insert
+from app.db.base import Base
+from app.db.connection import init_engine, open_session
+from app.db.models import UserModel, UserTokenModel
+from app.schemas.usertoken import UserTokenCreate
+from app.services.usertoken import UserTokenService
+from app.utils.jwt import token_digest
+from benchmarks.harness import bench_async
+
+SEED_BATCH_SIZE = 10000
+TOKENS_PER_USER = 5
+
+
+def fake_token(size: int, i: int):
+    """Return a unique refresh token stand-in"""
+    return f"seed-{size}-{i}"
+
+
+async def seed_user_tokens(size: int):
+    """Recreate the tables and fill user_token with size rows"""
+    async with init_engine().begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+        await connection.run_sync(Base.metadata.create_all)
+
+    users = [str(uuid.uuid4()) for _ in range(max(size // TOKENS_PER_USER, 1))]
+    expired_before = datetime.utcnow() - timedelta(days=30)
+
+    async with init_engine().begin() as connection:
+        for start in range(0, len(users), SEED_BATCH_SIZE):
+            await connection.execute(
+                insert(UserModel),
+                [
+                    {"uuid": user_uuid, "username": user_uuid}
+                    for user_uuid in users[start:start + SEED_BATCH_SIZE]
+                ],
+            )
+
+        for start in range(0, size, SEED_BATCH_SIZE):
+            await connection.execute(
+                insert(UserTokenModel),
+                [
+                    {
+                        "uuid": users[i % len(users)],
+                        "token_hash": token_digest(fake_token(size, i)),
+                        # one row out of ten is already expired
+                        "created_at": expired_before if i % 10 == 0 else datetime.utcnow(),
+                    }
+                    for i in range(start, min(start + SEED_BATCH_SIZE, size))
+                ],
+            )
+
+    return users
+
+
+async def run_usertoken_benchmarks(size: int, iterations: int):
+    """Benchmark every UserTokenService method against a table of size rows"""
+    users = await seed_user_tokens(size)
+    iterations = min(iterations, size // 4)
+    results = []
+
+    async with open_session() as db:
+        service = UserTokenService(db)
+
+        async def insert_token(i):
+            await service.insert_user_token(
+                UserTokenCreate(uuid=users[i % len(users)], refresh_token=f"new-{i}")
+            )
+
+        async def rotate_token(i):
+            # odd seeded rows, the even ones are consumed by the remove benchmark
+            j = 2 * i + 1
+            await service.rotate_user_token(
+                fake_token(size, j),
+                UserTokenCreate(uuid=users[j % len(users)], refresh_token=f"rotated-{i}"),
+            )
+
+        results.append(await bench_async(f"insert_user_token[{size}]", insert_token, iterations))
+        results.append(
+            await bench_async(
+                f"find_usertoken[{size}]",
+                lambda i: service.find_usertoken(fake_token(size, (i * 7919) % size)),
+                iterations,
+            )
+        )
+        results.append(await bench_async(f"rotate_user_token[{size}]", rotate_token, iterations))
+        results.append(
+            await bench_async(
+                f"remove_user_token_by_token[{size}]",
+                lambda i: service.remove_user_token_by_token(fake_token(size, 2 * i)),
+                iterations,
+            )
+        )
+        results.append(
+            await bench_async(
+                f"remove_all_user_tokens_by_uuid[{size}]",
+                lambda i: service.remove_all_user_tokens_by_uuid(users[i % len(users)]),
+                min(iterations, len(users)),
+            )
+        )
+        results.append(
+            await bench_async(
+                f"remove_expired_user_tokens[{size}]",
+                lambda i: service.remove_expired_user_tokens(
+                    datetime.utcnow() - timedelta(days=1), 100
+                ),
+                max(iterations // 10, 1),
+            )
+        )
+
+    async with init_engine().begin() as connection:
+        await connection.execute(delete(UserTokenModel))
+
+    return results
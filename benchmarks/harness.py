@@ -0,0 +1,104 @@
+"""Timing helpers, result reporting and baseline comparison"""
+import json
+import statistics
+import time
+from typing import Awaitable, Callable, Dict, List, NamedTuple
+
+
+class BenchmarkResult(NamedTuple):
+    """Throughput and latency percentiles of a benchmark"""
+
+    name: str
+    iterations: int
+    ops_per_sec: float
+    p50_us: float
+    p95_us: float
+    p99_us: float
+
+
+def summarize(name: str, samples: List[float]):
+    """Build a result from the per-operation durations, in seconds"""
+    ordered = sorted(samples)
+    quantiles = statistics.quantiles(ordered, n=100) if len(ordered) > 1 else ordered * 99
+
+    return BenchmarkResult(
+        name=name,
+        iterations=len(ordered),
+        ops_per_sec=len(ordered) / sum(ordered) if sum(ordered) else 0.0,
+        p50_us=quantiles[49] * 1e6,
+        p95_us=quantiles[94] * 1e6,
+        p99_us=quantiles[98] * 1e6,
+    )
+
+
+def bench(name: str, func: Callable[[int], object], iterations: int):
+    """Time a synchronous function called with the iteration number"""
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - start)
+
+    return summarize(name, samples)
+
+
+async def bench_async(name: str, func: Callable[[int], Awaitable], iterations: int):
+    """Time a coroutine function awaited with the iteration number"""
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        await func(i)
+        samples.append(time.perf_counter() - start)
+
+    return summarize(name, samples)
+
+
+def print_results(results: List[BenchmarkResult]):
+    """Print the results as a table"""
+    width = max(len(result.name) for result in results)
+    print(
+        f"{'benchmark':<{width}}  {'iters':>7}  {'ops/sec':>12}  "
+        f"{'p50 us':>10}  {'p95 us':>10}  {'p99 us':>10}"
+    )
+    for result in results:
+        print(
+            f"{result.name:<{width}}  {result.iterations:>7}  {result.ops_per_sec:>12.1f}  "
+            f"{result.p50_us:>10.1f}  {result.p95_us:>10.1f}  {result.p99_us:>10.1f}"
+        )
+
+
+def save_baseline(path: str, results: List[BenchmarkResult]):
+    """Store the results so later runs can be compared against them"""
+    with open(path, "w", encoding="utf-8") as baseline_file:
+        json.dump([result._asdict() for result in results], baseline_file, indent=2)
+
+
+def compare_baseline(path: str, results: List[BenchmarkResult], threshold: float):
+    """Print the throughput change against a baseline, returning the regressions"""
+    with open(path, encoding="utf-8") as baseline_file:
+        baseline: Dict[str, dict] = {
+            entry["name"]: entry for entry in json.load(baseline_file)
+        }
+
+    regressions = []
+    width = max(len(result.name) for result in results)
+    print(f"{'benchmark':<{width}}  {'baseline':>12}  {'current':>12}  {'change':>8}")
+
+    for result in results:
+        entry = baseline.get(result.name)
+        if entry is None or not entry["ops_per_sec"]:
+            print(f"{result.name:<{width}}  {'-':>12}  {result.ops_per_sec:>12.1f}  {'new':>8}")
+            continue
+
+        change = result.ops_per_sec / entry["ops_per_sec"] - 1
+        flag = ""
+        if change < -threshold:
+            regressions.append(result.name)
+            flag = "  REGRESSION"
+
+        print(
+            f"{result.name:<{width}}  {entry['ops_per_sec']:>12.1f}  "
+            f"{result.ops_per_sec:>12.1f}  {change:>+8.1%}{flag}"
+        )
+
+    return regressions
@@ -0,0 +1,118 @@
+"""Import-time budget of the application
+
+Every run imports app.main (which builds the application) in a fresh
+interpreter and keeps the fastest of the runs, the least disturbed by the
+host. A last run under -X importtime reports the slowest modules. The
+check fails when that time exceeds the budget, or when one of the
+modules that must only be imported on first use was loaded at startup.
+
+    python -m benchmarks.startup --budget-ms 1200
+"""
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+from typing import List, NamedTuple, Tuple
+import benchmarks  # noqa: F401 pylint: disable=unused-import
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+IMPORT_TIME_BUDGET_MS = 1200
+
+# loaded by the asymmetric JWT keys, the password hashing, the PostgreSQL
+# imports and the development server only
+DEFERRED_MODULES = (
+    "jose",
+    "cryptography.hazmat",
+    "passlib",
+    "bcrypt",
+    "argon2",
+    "asyncpg",
+    "sqlalchemy.dialects.postgresql",
+    "uvicorn",
+    "gunicorn",
+)
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app.main
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "modules": sorted(sys.modules)}))
+"""
+
+
+class StartupResult(NamedTuple):
+    """Import time of a run and the modules it loaded"""
+
+    seconds: float
+    modules: List[str]
+
+
+def parse_import_times(report: str, count: int):
+    """Return the modules with the highest self import time of a -X importtime report"""
+    times = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        times.append((name.strip(), int(self_us) / 1e6))
+
+    return sorted(times, key=lambda item: item[1], reverse=True)[:count]
+
+
+def run_probe(*options: str):
+    """Import the application in a new interpreter, returning the probe and its stderr"""
+    process = subprocess.run(
+        [sys.executable, *options, "-c", PROBE],
+        cwd=PROJECT_DIR,
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    probe = json.loads(process.stdout.splitlines()[-1])
+
+    return StartupResult(probe["seconds"], probe["modules"]), process.stderr
+
+
+def slowest_modules(count: int) -> List[Tuple[str, float]]:
+    """Return the modules taking the most time to import"""
+    _, report = run_probe("-X", "importtime")
+    return parse_import_times(report, count)
+
+
+def main():
+    """Measure the application import time and check it against the budget"""
+    parser = argparse.ArgumentParser(description="Application import-time budget check")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_TIME_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=10, help="slowest modules reported")
+    args = parser.parse_args()
+
+    results = [run_probe()[0] for _ in range(args.runs)]
+    best = min(results, key=lambda result: result.seconds)
+
+    print(f"{'module':<50}  {'self ms':>8}")
+    for name, seconds in slowest_modules(args.top):
+        print(f"{name:<50}  {seconds * 1000:>8.1f}")
+    print()
+    print(f"import app.main: {best.seconds * 1000:.1f} ms (budget {args.budget_ms:.0f} ms)")
+
+    failures = []
+    if best.seconds * 1000 > args.budget_ms:
+        failures.append("import time over budget")
+
+    loaded = set(best.modules)
+    for module in DEFERRED_MODULES:
+        if module in loaded:
+            failures.append(f"{module} is imported at startup")
+
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+"""Test configuration
+
+The defaults below are applied before any application module reads its
+settings, so the tests run without a .env file.
+"""
+import os
+
+TEST_ENVIRONMENT = {
+    "DB_URL": "sqlite+aiosqlite:///:memory:",
+    "ACCESS_TOKEN_PRIVATE_KEY": "test-access-token",
+    "REFRESH_TOKEN_PRIVATE_KEY": "test-refresh-token",
+    "ACCESS_TOKEN_EXPIRATION": "10",
+    "REFRESH_TOKEN_EXPIRATION": "10080",
+    "REDIS_URL": "redis://localhost:6379",
+}
+
+for name, value in TEST_ENVIRONMENT.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,147 @@
+"""The HS256 fast path must encode and accept exactly like python-jose"""
+import base64
+import hashlib
+import hmac
+import json
+import time
+from datetime import timedelta
+import pytest
+from jose import ExpiredSignatureError, JWTError, jwt
+from app.errors import TokenDecodingException, TokenExpiredException
+from app.utils import jwt as jwt_utils
+from app.utils.jwt import create_jwt_token, decode_token_payload
+
+SECRET = "test-secret"
+UUID = "0b5cf3c5-4f3e-4d1a-9a39-1f0c8d1b6f00"
+
+
+def b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def b64json(value) -> str:
+    """Encode a JSON segment the compact way python-jose does"""
+    return b64(json.dumps(value, separators=(",", ":"), sort_keys=True).encode())
+
+
+def sign_segments(header: str, payload: str, secret: str = SECRET, digestmod=hashlib.sha256):
+    """Sign already encoded header and payload segments"""
+    signing_input = f"{header}.{payload}"
+    signature = hmac.new(secret.encode(), signing_input.encode(), digestmod).digest()
+    return f"{signing_input}.{b64(signature)}"
+
+
+def sign(header: dict, payload, secret: str = SECRET, digestmod=hashlib.sha256) -> str:
+    """Build a token by hand, with any header and claims"""
+    return sign_segments(b64json(header), b64json(payload), secret, digestmod)
+
+
+def claims(**extra) -> dict:
+    return {"sub": UUID, "exp": int(time.time()) + 600, **extra}
+
+
+def fast_path_result(token):
+    try:
+        return "accepted", decode_token_payload(token, SECRET)
+    except TokenExpiredException:
+        return "expired", None
+    except TokenDecodingException:
+        return "rejected", None
+
+
+def jose_result(token):
+    try:
+        return "accepted", jwt.decode(token, SECRET, algorithms="HS256")
+    except ExpiredSignatureError:
+        return "expired", None
+    except JWTError:
+        return "rejected", None
+
+
+HS256 = {"alg": "HS256", "typ": "JWT"}
+VALID = sign(HS256, claims())
+HEADER, PAYLOAD, SIGNATURE = VALID.split(".")
+
+# tokens decided by the fast path alone, python-jose is never called for them
+FAST_PATH_TOKENS = {
+    "valid": VALID,
+    "valid_with_iat": sign(HS256, claims(iat=time.time())),
+    "bad_signature": sign(HS256, claims(), secret="another-secret"),
+    "tampered_payload": f"{HEADER}.{b64json(claims(sub='other'))}.{SIGNATURE}",
+    "expired": sign(HS256, claims(exp=int(time.time()) - 60)),
+    "exp_not_a_number": sign(HS256, claims(exp="soon")),
+    "iat_not_a_number": sign(HS256, claims(iat="now")),
+    "sub_not_a_string": sign(HS256, claims(sub=42)),
+    "padded_signature": f"{VALID}==",
+    "padded_payload": f"{HEADER}.{PAYLOAD}==.{SIGNATURE}",
+    "truncated_signature": VALID[:-1],
+    "invalid_base64": f"{HEADER}.{PAYLOAD}.{SIGNATURE[:-2]}*!",
+    "two_segments": f"{HEADER}.{PAYLOAD}",
+    "four_segments": f"{VALID}.{SIGNATURE}",
+    "empty": "",
+}
+
+# tokens the fast path doesn't handle and hands over to python-jose
+FALLBACK_TOKENS = {
+    # same claims and key, but the header has the default json.dumps spacing
+    "non_compact_header": sign_segments(b64(json.dumps(HS256).encode()), PAYLOAD),
+    "alg_none": f"{b64json({'alg': 'none', 'typ': 'JWT'})}.{PAYLOAD}.",
+    "alg_hs512": sign({"alg": "HS512", "typ": "JWT"}, claims(), digestmod=hashlib.sha512),
+    "alg_rs256": sign({"alg": "RS256", "typ": "JWT"}, claims()),
+    "extra_claim": sign(HS256, claims(role="admin")),
+    "not_yet_valid": sign(HS256, claims(nbf=int(time.time()) + 600)),
+    "audience": sign(HS256, claims(aud="another-service")),
+    "payload_not_an_object": sign(HS256, ["sub", "exp"]),
+}
+
+
+@pytest.fixture
+def jose_fallback(monkeypatch):
+    """Record the tokens handed over to python-jose by the fast path"""
+    calls = []
+    decode_with_jose = jwt_utils._decode_with_jose
+
+    def spy(token, secret):
+        calls.append(token)
+        return decode_with_jose(token, secret)
+
+    monkeypatch.setattr(jwt_utils, "_decode_with_jose", spy)
+    return calls
+
+
+def test_encoding_is_byte_identical_to_jose(monkeypatch):
+    now = 1700000000.123
+    monkeypatch.setattr(time, "time", lambda: now)
+
+    token = create_jwt_token(UUID, SECRET, timedelta(minutes=10))
+    payload = {"sub": UUID, "exp": 1700000600, "iat": 1700000000.123}
+
+    assert token == jwt.encode(payload, SECRET, algorithm="HS256")
+
+
+def test_fast_path_header_matches_jose():
+    assert HEADER == jwt_utils.HS256_HEADER_SEGMENT.decode()
+
+
+@pytest.mark.parametrize("name", FAST_PATH_TOKENS)
+def test_fast_path_decoding_matches_jose(name, jose_fallback):
+    token = FAST_PATH_TOKENS[name]
+
+    assert fast_path_result(token) == jose_result(token)
+    assert not jose_fallback
+
+
+@pytest.mark.parametrize("name", FALLBACK_TOKENS)
+def test_fallback_decoding_matches_jose(name, jose_fallback):
+    token = FALLBACK_TOKENS[name]
+
+    assert fast_path_result(token) == jose_result(token)
+    assert jose_fallback == [token]
+
+
+def test_created_tokens_round_trip(jose_fallback):
+    token = create_jwt_token(UUID, SECRET, timedelta(minutes=10))
+
+    assert decode_token_payload(token, SECRET) == jwt.decode(token, SECRET, algorithms="HS256")
+    assert decode_token_payload(token, SECRET)["sub"] == UUID
+    assert not jose_fallback